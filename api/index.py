@@ -3,29 +3,31 @@
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set, Iterable, Tuple
+from dataclasses import dataclass, field, fields
 from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from collections import deque
 import uuid
 import asyncio
+import time
 import sys
 import os
 
+import orjson
+
 # Add app directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import core modules
-from app.planner import PlannerEngine
-from app.executor import ExecutorEngine
-from app.validator import CompletionValidator
-from app.tools import ToolRegistry
-from app.models import OutcomeDefinition
-
 # Create FastAPI app
 app = FastAPI(
     title="Autonomous Agent API",
     description="Serverless API for the Autonomous Agent",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
@@ -37,15 +39,253 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory task storage (Note: Vercel functions are stateless, 
-# so tasks won't persist between cold starts)
-tasks_db: Dict[str, Dict] = {}
 
-# Initialize engines
-tool_registry = ToolRegistry()
-planner = PlannerEngine()
-executor = ExecutorEngine(tool_registry)
-validator = CompletionValidator()
+def _iso(ts: Optional[float]) -> Optional[str]:
+    """Format an epoch timestamp as a UTC ISO string for responses"""
+    return datetime.utcfromtimestamp(ts).isoformat() if ts is not None else None
+
+
+@dataclass(slots=True)
+class PlanStep:
+    """Single step of a task plan as reported to clients"""
+    step: int
+    action: str
+    description: str
+    status: str = "pending"
+    result: Any = None
+    error: Optional[str] = None
+    
+    def to_dict(self) -> Dict:
+        return {
+            "step": self.step,
+            "action": self.action,
+            "description": self.description,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+# Most recent history entries kept per task; older ones are dropped
+HISTORY_MAXLEN = int(os.getenv("HISTORY_MAXLEN", "200"))
+
+
+def _new_history(entries=()) -> deque:
+    return deque(entries, maxlen=HISTORY_MAXLEN)
+
+
+@dataclass(slots=True)
+class Task:
+    """Task record; timestamps are epoch floats, formatted only in to_dict()"""
+    task_id: str
+    user_id: str
+    goal: str
+    context: Dict[str, Any]
+    status: str = "analyzing"
+    plan: List[PlanStep] = field(default_factory=list)
+    current_step_index: int = 0
+    history: deque = field(default_factory=_new_history)
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    completed_at: Optional[float] = None
+    outcome: Optional[Dict] = None
+    error: Optional[str] = None
+    # Engine ExecutionSteps backing `plan`, kept so a timed-out task can resume
+    steps: List[Any] = field(default_factory=list, repr=False)
+    
+    def to_dict(self) -> Dict:
+        return {
+            "task_id": self.task_id,
+            "user_id": self.user_id,
+            "goal": self.goal,
+            "context": self.context,
+            "status": self.status,
+            "plan": [step.to_dict() for step in self.plan],
+            "current_step_index": self.current_step_index,
+            "history": list(self.history),
+            "created_at": _iso(self.created_at),
+            "updated_at": _iso(self.updated_at),
+            "completed_at": _iso(self.completed_at),
+            "outcome": self.outcome,
+            "error": self.error,
+        }
+    
+    def to_fields(self, names: Iterable[str] = ()) -> Dict[str, str]:
+        """Encode attributes (all if `names` is empty) as JSON strings for a Redis hash"""
+        encoded = {}
+        for name in names or [f.name for f in fields(self)]:
+            value = getattr(self, name)
+            if name == "plan":
+                value = [step.to_dict() for step in value]
+            elif name == "steps":
+                value = [step.model_dump(mode="json") for step in value]
+            elif name == "history":
+                value = list(value)
+            encoded[name] = orjson.dumps(value, default=str).decode()
+        return encoded
+    
+    @classmethod
+    def from_fields(cls, encoded: Dict[str, str]) -> "Task":
+        """Rebuild a task from to_fields() output; `steps` stay plain dicts"""
+        values = {name: orjson.loads(raw) for name, raw in encoded.items()}
+        values["plan"] = [PlanStep(**step) for step in values.get("plan", [])]
+        values["history"] = _new_history(values.get("history", ()))
+        return cls(**values)
+
+
+class TaskStore:
+    """In-process task storage (Vercel functions are stateless, so tasks
+    won't persist between cold starts or across instances)"""
+    
+    def __init__(self):
+        self.tasks: Dict[str, Task] = {}
+    
+    async def get(self, task_id: str) -> Optional[Task]:
+        return self.tasks.get(task_id)
+    
+    async def save(self, task: Task, *names: str):
+        """Persist a task; `names` lists the attributes that changed (all if omitted)"""
+        self.tasks[task.task_id] = task
+    
+    async def list(self, offset: int = 0, limit: int = 100,
+                   status: Optional[str] = None) -> Tuple[List[Task], int]:
+        """Return a page of tasks (optionally filtered by status) and how many match"""
+        if not status:
+            return list(islice(self.tasks.values(), offset, offset + limit)), len(self.tasks)
+        matching = [task for task in self.tasks.values() if task.status == status]
+        return matching[offset:offset + limit], len(matching)
+
+
+class RedisTaskStore(TaskStore):
+    """
+    Task storage in Upstash Redis / Vercel KV, shared by every instance.
+    Each task is a hash with one JSON field per attribute so updates only
+    write the fields that changed; a sorted set indexes tasks by creation time.
+    """
+    
+    INDEX_KEY = "tasks"
+    
+    def __init__(self, redis, ttl: int):
+        self.redis = redis
+        self.ttl = ttl
+    
+    @staticmethod
+    def _key(task_id: str) -> str:
+        return f"task:{task_id}"
+    
+    async def get(self, task_id: str) -> Optional[Task]:
+        encoded = await self.redis.hgetall(self._key(task_id))
+        return Task.from_fields(encoded) if encoded else None
+    
+    async def save(self, task: Task, *names: str):
+        key = self._key(task.task_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, values=task.to_fields(names))
+        pipe.expire(key, self.ttl)
+        if not names:
+            pipe.zadd(self.INDEX_KEY, {task.task_id: task.created_at})
+            pipe.zremrangebyscore(self.INDEX_KEY, 0, time.time() - self.ttl)
+        await pipe.exec()
+    
+    async def list(self, offset: int = 0, limit: int = 100,
+                   status: Optional[str] = None) -> Tuple[List[Task], int]:
+        if not status:
+            total = await self.redis.zcard(self.INDEX_KEY)
+            task_ids = await self.redis.zrange(self.INDEX_KEY, offset, offset + limit - 1)
+        else:
+            # Filter on the status field alone before loading whole tasks
+            task_ids = await self.redis.zrange(self.INDEX_KEY, 0, -1)
+            pipe = self.redis.pipeline()
+            for task_id in task_ids:
+                pipe.hget(self._key(task_id), "status")
+            statuses = await pipe.exec() if task_ids else []
+            encoded_status = orjson.dumps(status).decode()
+            matching = [
+                task_id for task_id, value in zip(task_ids, statuses)
+                if value == encoded_status
+            ]
+            # The total counts only the matching tasks, so pages add up
+            total = len(matching)
+            task_ids = matching[offset:offset + limit]
+        if not task_ids:
+            return [], total
+        pipe = self.redis.pipeline()
+        for task_id in task_ids:
+            pipe.hgetall(self._key(task_id))
+        return [Task.from_fields(encoded) for encoded in await pipe.exec() if encoded], total
+
+
+def create_task_store() -> TaskStore:
+    """Use Redis when Upstash credentials are configured, otherwise keep tasks in memory"""
+    if os.getenv("UPSTASH_REDIS_REST_URL") and os.getenv("UPSTASH_REDIS_REST_TOKEN"):
+        from upstash_redis.asyncio import Redis
+        return RedisTaskStore(Redis.from_env(), ttl=int(os.getenv("TASK_TTL_SECONDS", "3600")))
+    return TaskStore()
+
+
+# Created once per instance and reused across warm invocations
+task_store = create_task_store()
+
+# Execution budget per invocation, kept under Vercel's function timeout
+TASK_TIMEOUT_SECONDS = float(os.getenv("TASK_TIMEOUT_SECONDS", "55"))
+
+# How long /poll waits for a change before returning the current state
+LONG_POLL_SECONDS = float(os.getenv("LONG_POLL_SECONDS", "25"))
+
+# One event per task being long-polled; replaced on every update so each
+# waiter wakes exactly once without racing a set()/clear() pair
+_task_events: Dict[str, asyncio.Event] = {}
+
+
+async def save_task(task: Task, *names: str):
+    """Persist a task and wake any long-polls waiting on it"""
+    await task_store.save(task, *names)
+    event = _task_events.pop(task.task_id, None)
+    if event:
+        event.set()
+
+
+class _UuidPool:
+    """Random v4 UUIDs cut from one buffered os.urandom read instead of a syscall each"""
+    
+    BATCH = 1024
+    
+    def __init__(self):
+        self._buf = b""
+        self._i = 0
+        self._pid = os.getpid()
+    
+    def get(self) -> str:
+        # Refill when exhausted, or after a fork so workers never share a buffer
+        if self._i + 16 > len(self._buf) or self._pid != os.getpid():
+            self._buf = os.urandom(16 * self.BATCH)
+            self._i = 0
+            self._pid = os.getpid()
+        raw = self._buf[self._i:self._i + 16]
+        self._i += 16
+        return str(uuid.UUID(bytes=raw, version=4))
+
+
+_uuid_pool = _UuidPool()
+
+# Strong references to background executions so they aren't garbage
+# collected mid-run; each entry removes itself when done
+_bg_tasks: Set[asyncio.Task] = set()
+
+
+@lru_cache(maxsize=None)
+def get_engines():
+    """
+    Initialize engines on first use.
+    Core modules are imported here rather than at module level so that
+    cold starts serving only "/" or "/health" skip loading them.
+    """
+    from app.planner import PlannerEngine
+    from app.executor import ExecutorEngine
+    from app.validator import CompletionValidator
+    from app.tools import tool_registry
+    
+    return PlannerEngine(), ExecutorEngine(tool_registry), CompletionValidator()
 
 
 class CreateTaskRequest(BaseModel):
@@ -77,27 +317,19 @@ async def health():
 @app.post("/tasks")
 async def create_task(request: CreateTaskRequest):
     """Create and execute a new task"""
-    task_id = str(uuid.uuid4())
+    task_id = _uuid_pool.get()
     
-    task = {
-        "task_id": task_id,
-        "user_id": request.user_id,
-        "goal": request.goal,
-        "context": request.context or {},
-        "status": "analyzing",
-        "plan": [],
-        "current_step_index": 0,
-        "history": [],
-        "created_at": datetime.utcnow().isoformat(),
-        "updated_at": datetime.utcnow().isoformat(),
-        "outcome": None,
-        "error": None,
-    }
+    task = Task(
+        task_id=task_id,
+        user_id=request.user_id,
+        goal=request.goal,
+        context=request.context or {},
+    )
     
-    tasks_db[task_id] = task
+    await save_task(task)
     
     # Execute task in background (limited by Vercel's timeout)
-    asyncio.create_task(execute_task(task_id))
+    start_execution(task_id)
     
     return TaskResponse(
         task_id=task_id,
@@ -106,136 +338,219 @@ async def create_task(request: CreateTaskRequest):
     )
 
 
+def start_execution(task_id: str) -> asyncio.Task:
+    """Run execute_task in the background under the invocation deadline"""
+    bg_task = asyncio.create_task(run_with_deadline(task_id))
+    _bg_tasks.add(bg_task)
+    bg_task.add_done_callback(_bg_tasks.discard)
+    return bg_task
+
+
+async def run_with_deadline(task_id: str):
+    """
+    Execute a task, stopping before the platform freezes the function.
+    On timeout the task is marked "timeout" with its progress kept, so a
+    later /respond call resumes from the current step.
+    """
+    try:
+        await asyncio.wait_for(execute_task(task_id), timeout=TASK_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        task = await task_store.get(task_id)
+        if not task:
+            return
+        # Only a step cut off mid-run goes back to pending; one that already
+        # finished (e.g. the deadline hit during validation) must not rerun
+        if task.current_step_index < len(task.plan) and task.plan[task.current_step_index].status == "running":
+            task.plan[task.current_step_index].status = "pending"
+        task.status = "timeout"
+        task.error = f"Execution paused after {TASK_TIMEOUT_SECONDS:.0f}s; respond to resume"
+        task.updated_at = time.time()
+        await save_task(task, "plan", "status", "error", "updated_at")
+
+
+def _apply_step_result(task: Task, i: int, *, status: str, result: Optional[Dict] = None,
+                       error: Optional[str] = None, now: Optional[float] = None) -> tuple:
+    """Record a finished step in one pass; returns the task fields that changed"""
+    now = now if now is not None else time.time()
+    plan_step = task.plan[i]
+    plan_step.status = status
+    plan_step.result = result
+    plan_step.error = error
+    
+    entry = {"step": i + 1, "action": plan_step.action, "status": status}
+    if error is not None:
+        entry["error"] = error
+    entry["timestamp"] = _iso(now)
+    task.history.append(entry)
+    
+    task.updated_at = now
+    return ("steps", "plan", "history", "updated_at")
+
+
 async def execute_task(task_id: str):
-    """Execute the full task pipeline"""
-    task = tasks_db.get(task_id)
+    """Execute the full task pipeline, resuming from the current step if already planned"""
+    task = await task_store.get(task_id)
     if not task:
         return
     
+    from app.models import OutcomeDefinition, ExecutionStep
+    planner, executor, validator = get_engines()
+    
+    if task.steps and isinstance(task.steps[0], dict):
+        # Loaded from an external store: rebuild the engine steps
+        task.steps = [ExecutionStep.model_validate(step) for step in task.steps]
+    
     try:
-        # Planning phase
-        task["status"] = "planning"
-        task["updated_at"] = datetime.utcnow().isoformat()
-        
         outcome = OutcomeDefinition(
-            original_goal=task["goal"],
-            success_criteria=[f"Successfully completed: {task['goal']}"],
+            original_goal=task.goal,
+            success_criteria=[f"Successfully completed: {task.goal}"],
             validation_method="rule_based",
             domain="general",
         )
-        plan = await planner.create_plan(outcome, task["context"])
-        task["plan"] = [
-            {"step": i+1, "action": step.action_type, "description": step.description, "status": "pending"}
-            for i, step in enumerate(plan)
-        ]
+        
+        # Planning phase (skipped when resuming)
+        if not task.steps:
+            task.status = "planning"
+            task.updated_at = time.time()
+            await save_task(task, "status", "updated_at")
+            
+            task.steps = await planner.create_plan(outcome, task.context)
+            task.plan = [
+                PlanStep(step=i+1, action=step.action_type, description=step.description)
+                for i, step in enumerate(task.steps)
+            ]
         
         # Execution phase
-        task["status"] = "executing"
-        task["updated_at"] = datetime.utcnow().isoformat()
+        task.status = "executing"
+        task.error = None
+        task.updated_at = time.time()
+        await save_task(task, "steps", "plan", "status", "error", "updated_at")
         
-        for i, step in enumerate(plan):
-            task["current_step_index"] = i
-            task["plan"][i]["status"] = "running"
-            task["updated_at"] = datetime.utcnow().isoformat()
+        for i in range(task.current_step_index, len(task.steps)):
+            # A deadline can land after a step finished (e.g. during
+            # validation); completed steps never run again on resume
+            if task.plan[i].status == "completed":
+                continue
+            step = task.steps[i]
+            task.current_step_index = i
+            task.plan[i].status = "running"
+            task.updated_at = time.time()
+            await save_task(task, "current_step_index", "plan", "updated_at")
             
             try:
-                result = await executor.execute_step(step, task["context"])
-                task["plan"][i]["status"] = "completed"
-                task["plan"][i]["result"] = result
-                task["context"].update(result.get("context_updates", {}))
-                task["history"].append({
-                    "step": i + 1,
-                    \"action\": step.action_type,
-                    "status": "completed",
-                    "timestamp": datetime.utcnow().isoformat()
-                })
+                result = await executor.execute_step(step, task.context)
+                task.context.update(result.get("context_updates", {}))
+                changed = _apply_step_result(task, i, status="completed", result=result)
             except Exception as e:
-                task["plan"][i]["status"] = "failed"
-                task["plan"][i]["error"] = str(e)
-                task["history"].append({
-                    "step": i + 1,
-                    \"action\": step.action_type,
-                    "status": "failed",
-                    "error": str(e),
-                    "timestamp": datetime.utcnow().isoformat()
-                })
+                changed = _apply_step_result(task, i, status="failed", error=str(e))
+            await save_task(task, "context", *changed)
         
         # Validation phase
-        task["status"] = "validating"
-        task["updated_at"] = datetime.utcnow().isoformat()
+        task.status = "validating"
+        task.updated_at = time.time()
+        await save_task(task, "status", "updated_at")
         
-        validation = await validator.validate_completion(outcome, task["context"], task["history"])
+        validation = await validator.validate_completion(outcome, task.context, list(task.history))
+        now = time.time()
         
         if validation.get("completed", False):
-            task["status"] = "completed"
-            task["outcome"] = {
+            task.status = "completed"
+            task.outcome = {
                 "success": True,
-                "goal": task["goal"],
-                "confirmation_details": task["context"],
-                "completed_at": datetime.utcnow().isoformat()
+                "goal": task.goal,
+                "confirmation_details": task.context,
+                "completed_at": _iso(now)
             }
         else:
-            task["status"] = "failed"
-            task["error"] = "; ".join(validation.get("recommendations", ["Validation failed"]))
+            task.status = "failed"
+            task.error = "; ".join(validation.get("recommendations", ["Validation failed"]))
             
-        task["completed_at"] = datetime.utcnow().isoformat()
-        task["updated_at"] = datetime.utcnow().isoformat()
+        task.completed_at = now
+        task.updated_at = now
+        await save_task(task, "status", "outcome", "error", "completed_at", "updated_at")
         
     except Exception as e:
-        task["status"] = "failed"
-        task["error"] = str(e)
-        task["updated_at"] = datetime.utcnow().isoformat()
+        task.status = "failed"
+        task.error = str(e)
+        task.updated_at = time.time()
+        await save_task(task, "status", "error", "updated_at")
 
 
 @app.get("/tasks")
-async def get_tasks():
-    """Get all tasks"""
-    return {"tasks": list(tasks_db.values())}
+async def get_tasks(limit: int = 100, offset: int = 0, status: Optional[str] = None):
+    """Get a page of tasks, optionally filtered by status"""
+    limit = max(1, min(limit, 500))
+    offset = max(0, offset)
+    tasks, total = await task_store.list(offset, limit, status)
+    # Returned as a response directly so the payload goes straight to orjson
+    # without a jsonable_encoder pass over every task's plan and history
+    return ORJSONResponse({
+        "tasks": [task.to_dict() for task in tasks],
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+    })
 
 
 @app.get("/tasks/{task_id}")
 async def get_task(task_id: str):
     """Get task status (for polling)"""
-    task = tasks_db.get(task_id)
+    task = await task_store.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return task
+    return task.to_dict()
 
 
 @app.get("/tasks/{task_id}/poll")
-async def poll_task(task_id: str):
-    """Poll for task updates (replaces WebSocket)"""
-    task = tasks_db.get(task_id)
+async def poll_task(task_id: str, if_updated_since: Optional[float] = None):
+    """
+    Poll for task updates (replaces WebSocket).
+    Pass the last `updated_ts` as `if_updated_since` to long-poll: the request
+    waits up to LONG_POLL_SECONDS for a change before returning.
+    """
+    task = await task_store.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    if (if_updated_since is not None and task.updated_at <= if_updated_since
+            and task.status not in ("completed", "failed")):
+        event = _task_events.setdefault(task_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=LONG_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        # Re-read: with a shared store the update may come from another instance
+        task = await task_store.get(task_id) or task
+    
     return {
         "task_id": task_id,
-        "status": task["status"],
-        "current_step": task["current_step_index"] + 1,
-        "total_steps": len(task["plan"]),
-        "plan": task["plan"],
-        "outcome": task.get("outcome"),
-        "error": task.get("error"),
-        "updated_at": task["updated_at"]
+        "status": task.status,
+        "current_step": task.current_step_index + 1,
+        "total_steps": len(task.plan),
+        "plan": [step.to_dict() for step in task.plan],
+        "outcome": task.outcome,
+        "error": task.error,
+        "updated_at": _iso(task.updated_at),
+        "updated_ts": task.updated_at
     }
 
 
 @app.post("/tasks/{task_id}/respond")
 async def respond_to_interrupt(task_id: str, response: InterruptResponse):
     """Respond to an interruption"""
-    task = tasks_db.get(task_id)
+    task = await task_store.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if task["status"] != "interrupted":
+    if task.status not in ("interrupted", "timeout"):
         raise HTTPException(status_code=400, detail="Task is not interrupted")
     
-    task["context"]["user_response"] = response.response
-    task["status"] = "executing"
-    task["updated_at"] = datetime.utcnow().isoformat()
+    task.context["user_response"] = response.response
+    task.status = "executing"
+    task.updated_at = time.time()
+    await save_task(task, "context", "status", "updated_at")
     
-    asyncio.create_task(execute_task(task_id))
+    start_execution(task_id)
     
     return {"status": "resumed", "task_id": task_id}
 
@@ -243,18 +558,18 @@ async def respond_to_interrupt(task_id: str, response: InterruptResponse):
 @app.get("/tasks/{task_id}/result")
 async def get_task_result(task_id: str):
     """Get final task result"""
-    task = tasks_db.get(task_id)
+    task = await task_store.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if task["status"] not in ["completed", "failed"]:
-        return {"status": task["status"], "message": "Task still in progress"}
+    if task.status not in ["completed", "failed"]:
+        return {"status": task.status, "message": "Task still in progress"}
     
     return {
         "task_id": task_id,
-        "status": task["status"],
-        "outcome": task.get("outcome"),
-        "error": task.get("error")
+        "status": task.status,
+        "outcome": task.outcome,
+        "error": task.error
     }
 
 
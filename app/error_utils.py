@@ -1,6 +1,7 @@
 """
 Error Utilities - Centralized error handling with user-friendly messages
 """
+import re
 from enum import Enum
 from typing import Dict, Optional, List
 from dataclasses import dataclass
@@ -170,9 +171,51 @@ ERROR_DEFINITIONS: Dict[ErrorCode, ErrorInfo] = {
 }
 
 
+# Definitions laid out in ErrorCode declaration order. Each member carries its
+# position, so lookups index a tuple instead of hashing the enum
+# (Enum.__hash__ is a Python-level call).
+_ERROR_TABLE = tuple(
+    ERROR_DEFINITIONS.get(code, ERROR_DEFINITIONS[ErrorCode.UNKNOWN]) for code in ErrorCode
+)
+for _index, _code in enumerate(ErrorCode):
+    _code._table_index = _index
+_UNKNOWN_INDEX = ErrorCode.UNKNOWN._table_index
+
+
+# Keywords that identify an error code, checked in this priority order
+_ERROR_KEYWORDS: List[tuple] = [
+    (ErrorCode.TIMEOUT, ("timeout", "timed out")),
+    (ErrorCode.NETWORK, ("connection", "network")),
+    (ErrorCode.UNAVAILABLE, ("not found", "unavailable")),
+    (ErrorCode.SOLD_OUT, ("sold out", "no availability")),
+    (ErrorCode.PAYMENT_DECLINED, ("declined",)),
+    (ErrorCode.INSUFFICIENT_FUNDS, ("insufficient",)),
+    (ErrorCode.CARD_EXPIRED, ("expired",)),
+    (ErrorCode.RATE_LIMITED, ("rate limit", "too many")),
+]
+
+# Python-specific errors that shouldn't be shown to users
+_PYTHON_INDICATORS = frozenset([
+    "name '", "' is not defined",
+    "attributeerror", "typeerror", "keyerror", "valueerror",
+    "traceback", "file \"", "line ", "exception",
+])
+
+# All keywords in one alternation so a message is scanned in a single pass.
+# The lookahead reports overlapping matches, e.g. "service" inside "web service down".
+_ALL_KEYWORDS = (
+    {kw for _, kws in _ERROR_KEYWORDS for kw in kws}
+    | {"service", "down"}
+    | _PYTHON_INDICATORS
+)
+_ERROR_SCAN_RE = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for kw in sorted(_ALL_KEYWORDS, key=len, reverse=True)) + "))"
+)
+
+
 def get_error_info(code: ErrorCode) -> ErrorInfo:
     """Get error info for a given error code"""
-    return ERROR_DEFINITIONS.get(code, ERROR_DEFINITIONS[ErrorCode.UNKNOWN])
+    return _ERROR_TABLE[getattr(code, "_table_index", _UNKNOWN_INDEX)]
 
 
 def parse_technical_error(error_message: str) -> ErrorInfo:
@@ -180,43 +223,19 @@ def parse_technical_error(error_message: str) -> ErrorInfo:
     Parse a technical error message and return user-friendly error info.
     This helps convert Python exceptions and raw errors into user-friendly messages.
     """
-    error_lower = error_message.lower()
-    
-    # Pattern matching for common errors
-    if "timeout" in error_lower or "timed out" in error_lower:
-        return get_error_info(ErrorCode.TIMEOUT)
-    
-    if "connection" in error_lower or "network" in error_lower:
-        return get_error_info(ErrorCode.NETWORK)
-    
-    if "not found" in error_lower or "unavailable" in error_lower:
-        return get_error_info(ErrorCode.UNAVAILABLE)
-    
-    if "sold out" in error_lower or "no availability" in error_lower:
-        return get_error_info(ErrorCode.SOLD_OUT)
-    
-    if "payment declined" in error_lower or "declined" in error_lower:
-        return get_error_info(ErrorCode.PAYMENT_DECLINED)
-    
-    if "insufficient" in error_lower:
-        return get_error_info(ErrorCode.INSUFFICIENT_FUNDS)
-    
-    if "expired" in error_lower:
-        return get_error_info(ErrorCode.CARD_EXPIRED)
-    
-    if "rate limit" in error_lower or "too many" in error_lower:
-        return get_error_info(ErrorCode.RATE_LIMITED)
+    # Collect every known keyword in one scan, then apply rules by priority
+    found = {m.group(1) for m in _ERROR_SCAN_RE.finditer(error_message.lower())}
     
-    if "service" in error_lower and ("down" in error_lower or "unavailable" in error_lower):
-        return get_error_info(ErrorCode.SERVICE_DOWN)
+    if found:
+        for code, keywords in _ERROR_KEYWORDS:
+            if not found.isdisjoint(keywords):
+                return get_error_info(code)
+        
+        # "service ... unavailable" is already caught as UNAVAILABLE above
+        if "service" in found and "down" in found:
+            return get_error_info(ErrorCode.SERVICE_DOWN)
     
-    # Python-specific errors that shouldn't be shown to users
-    python_indicators = [
-        "name '", "' is not defined",
-        "attributeerror", "typeerror", "keyerror", "valueerror",
-        "traceback", "file \"", "line ", "exception",
-    ]
-    if any(indicator in error_lower for indicator in python_indicators):
+    if not found.isdisjoint(_PYTHON_INDICATORS):
         return ErrorInfo(
             code=ErrorCode.UNKNOWN,
             category=ErrorCategory.RECOVERABLE,
@@ -2,12 +2,25 @@
 Executor Engine - Executes individual steps and manages plan execution
 """
 import asyncio
+import re
+from collections import defaultdict, deque
 from typing import Dict, Callable, List, Set
 from datetime import datetime
 
 from .models import ExecutionStep, TaskState, StepStatus, ExecutionError, HumanInterruptionRequired
 
 
+# Matches embedded {{variable}} placeholders in string parameters
+_TEMPLATE_RE = re.compile(r'\{\{(\w+)\}\}')
+
+# Compiled parameter resolvers kept per executor before the cache is reset
+_COMPILED_PARAMS_LIMIT = 1024
+
+
+async def _no_progress(update: Dict):
+    """Stand-in progress callback so callers don't need to check for None"""
+
+
 class ExecutorEngine:
     """
     Executes steps using appropriate handlers.
@@ -17,6 +30,9 @@ class ExecutorEngine:
     def __init__(self, tool_registry):
         self.tools = tool_registry
         self.active_executions: Dict[str, asyncio.Task] = {}
+        # id(parameters) -> (parameters, compiled resolver); the template is
+        # kept in the entry so its id can't be reused while cached
+        self._compiled_params: Dict[int, tuple] = {}
     
     async def execute_step(self, step: ExecutionStep, context: Dict) -> Dict:
         """
@@ -80,40 +96,61 @@ class ExecutorEngine:
         Replace {{variable}} placeholders with values from context.
         Also handles nested dictionaries.
         """
-        resolved = {}
-        
-        for key, value in params.items():
-            if isinstance(value, str):
-                if value.startswith("{{") and value.endswith("}}"):
-                    # Direct template variable
-                    var_name = value[2:-2]
-                    resolved[key] = context.get(var_name)
-                elif "{{" in value and "}}" in value:
-                    # String with embedded template variables
-                    import re
-                    def replace_var(match):
-                        var_name = match.group(1)
-                        return str(context.get(var_name, match.group(0)))
-                    resolved[key] = re.sub(r'\{\{(\w+)\}\}', replace_var, value)
-                else:
-                    resolved[key] = value
-            elif isinstance(value, dict):
-                # Recursively resolve nested dictionaries
-                resolved[key] = self._resolve_parameters(value, context)
-            elif isinstance(value, list):
-                # Resolve items in lists
-                resolved_list = []
-                for item in value:
-                    if isinstance(item, str) and item.startswith("{{") and item.endswith("}}"):
-                        var_name = item[2:-2]
-                        resolved_list.append(context.get(var_name))
-                    else:
-                        resolved_list.append(item)
-                resolved[key] = resolved_list
-            else:
-                resolved[key] = value
-        
-        return resolved
+        entry = self._compiled_params.get(id(params))
+        if entry is None or entry[0] is not params:
+            if len(self._compiled_params) >= _COMPILED_PARAMS_LIMIT:
+                self._compiled_params.clear()
+            entry = (params, self._compile_params(params))
+            self._compiled_params[id(params)] = entry
+        return entry[1](context)
+    
+    def _compile_params(self, template: Dict) -> Callable[[Dict], Dict]:
+        """
+        Walk a parameter template once and return a function that fills it
+        from a context, so repeated executions skip the type checks and regex.
+        """
+        resolvers = [(key, self._compile_value(value)) for key, value in template.items()]
+        return lambda context: {key: resolve(context) for key, resolve in resolvers}
+    
+    def _compile_value(self, value) -> Callable[[Dict], object]:
+        if isinstance(value, str):
+            if "{{" not in value:
+                return lambda context: value
+            if value.startswith("{{") and value.endswith("}}"):
+                # Direct template variable
+                var_name = value[2:-2]
+                return lambda context: context.get(var_name)
+            if "}}" in value:
+                # String with embedded template variables: split into
+                # literal text (even indexes) and variable names (odd indexes)
+                parts = _TEMPLATE_RE.split(value)
+                literals = parts[0::2]
+                names = parts[1::2]
+                
+                def resolve_embedded(context):
+                    out = [literals[0]]
+                    for name, literal in zip(names, literals[1:]):
+                        out.append(str(context.get(name, "{{" + name + "}}")))
+                        out.append(literal)
+                    return "".join(out)
+                return resolve_embedded
+            return lambda context: value
+        if isinstance(value, dict):
+            # Recursively resolve nested dictionaries
+            return self._compile_params(value)
+        if isinstance(value, list):
+            # Only whole-item {{variable}} entries are resolved in lists
+            items = [
+                item[2:-2] if isinstance(item, str) and item.startswith("{{") and item.endswith("}}") else None
+                for item in value
+            ]
+            if not any(items):
+                return lambda context: list(value)
+            return lambda context: [
+                context.get(name) if name is not None else item
+                for name, item in zip(items, value)
+            ]
+        return lambda context: value
     
     async def execute_plan(
         self,
@@ -132,81 +169,128 @@ class ExecutorEngine:
         Returns:
             Dict with success status and final context
         """
+        progress_callback = progress_callback or _no_progress
         completed_steps: Set[str] = set()
+        
+        # Progress updates run alongside the following steps instead of
+        # blocking them; they are awaited before returning
+        callback_tasks: List[asyncio.Task] = []
+        
+        def report(update: Dict):
+            callback_tasks.append(asyncio.create_task(progress_callback(update)))
+        
+        async def flush_reports():
+            results = await asyncio.gather(*callback_tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"  Progress callback failed: {result}")
         step_index_map = {step.id: i for i, step in enumerate(plan)}
         
-        while len(completed_steps) < len(plan):
-            # Find ready steps (dependencies met and not yet completed)
-            ready_steps = [
-                step for step in plan
-                if step.id not in completed_steps
-                and step.status != StepStatus.COMPLETED
-                and all(dep in completed_steps for dep in step.dependencies)
-            ]
-            
-            if not ready_steps:
-                # Check for deadlocks
-                pending = [s for s in plan if s.id not in completed_steps]
-                if pending:
-                    pending_info = [
-                        f"{s.id} (depends on: {s.dependencies})" 
-                        for s in pending
-                    ]
-                    raise ExecutionError(f"Deadlock detected: {pending_info}")
-                break
+        # Kahn's algorithm: count unmet dependencies per step and release
+        # dependents as each step completes, instead of rescanning the plan
+        in_degree = {step.id: len(step.dependencies) for step in plan}
+        dependents: Dict[str, List[ExecutionStep]] = defaultdict(list)
+        for step in plan:
+            for dep in step.dependencies:
+                dependents[dep].append(step)
+        
+        def mark_completed(step_id: str) -> List[ExecutionStep]:
+            """Record completion and return dependents that became ready"""
+            completed_steps.add(step_id)
+            newly_ready = []
+            for dependent in dependents.get(step_id, ()):
+                in_degree[dependent.id] -= 1
+                if in_degree[dependent.id] == 0 and dependent.id not in completed_steps:
+                    newly_ready.append(dependent)
+            return newly_ready
+        
+        # Steps completed in a previous run count as satisfied dependencies
+        for step in plan:
+            if step.status == StepStatus.COMPLETED:
+                mark_completed(step.id)
+        
+        ready = deque(
+            step for step in plan
+            if in_degree[step.id] == 0 and step.id not in completed_steps
+        )
+        
+        while ready:
+            # Execute every ready step as one batch (can be parallel if independent)
+            ready_steps = list(ready)
+            ready.clear()
             
             print(f"\nExecuting batch of {len(ready_steps)} step(s)...")
             
-            # Execute ready steps (can be parallel if independent)
-            tasks = []
-            for step in ready_steps:
-                task = self.execute_step(step, context)
-                tasks.append((step, task))
-            
-            # Wait for all to complete
-            results = await asyncio.gather(
-                *[t[1] for t in tasks],
-                return_exceptions=True
-            )
+            task_to_step = {
+                asyncio.create_task(self.execute_step(step, context)): step
+                for step in ready_steps
+            }
+            pending_tasks = set(task_to_step)
+            failure = None
             
-            # Process results
-            for (step, _), result in zip(tasks, results):
-                if isinstance(result, Exception):
-                    step.status = StepStatus.FAILED
-                    step.error = str(result)
+            # Process each step as soon as it finishes. After a failure the rest
+            # of the batch still runs to completion - cancelling could abort a
+            # payment or booking halfway - and their results are kept
+            while pending_tasks:
+                done, pending_tasks = await asyncio.wait(
+                    pending_tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    step = task_to_step.pop(task)
+                    error = task.exception()
                     
-                    # Call progress callback if provided
-                    if progress_callback:
-                        await progress_callback({
+                    if error is not None:
+                        step.status = StepStatus.FAILED
+                        step.error = str(error)
+                        
+                        # Report progress
+                        report({
                             "type": "step_failed",
                             "step_id": step.id,
                             "step_index": step_index_map.get(step.id, 0),
-                            "error": str(result)
+                            "error": str(error)
                         })
+                        
+                        if failure is None:
+                            failure = {
+                                "success": False,
+                                "failed_step": step,
+                                "error": error,
+                                "step_index": step_index_map.get(step.id, 0)
+                            }
+                        continue
                     
-                    return {
-                        "success": False,
-                        "failed_step": step,
-                        "error": result,
-                        "step_index": step_index_map.get(step.id, 0)
-                    }
-                else:
-                    # Success - mark completed and update context
-                    completed_steps.add(step.id)
+                    # Success - mark completed, release dependents and update context
+                    result = task.result()
+                    ready.extend(mark_completed(step.id))
                     context.update(result.get("context_updates", {}))
                     
-                    # Call progress callback if provided
-                    if progress_callback:
-                        await progress_callback({
-                            "type": "step_complete",
-                            "step_id": step.id,
-                            "step_index": step_index_map.get(step.id, 0),
-                            "description": step.description,
-                            "result": result
-                        })
+                    # Report progress
+                    report({
+                        "type": "step_complete",
+                        "step_id": step.id,
+                        "step_index": step_index_map.get(step.id, 0),
+                        "description": step.description,
+                        "result": result
+                    })
+            
+            if failure is not None:
+                await flush_reports()
+                return failure
             
             print(f"  Progress: {len(completed_steps)}/{len(plan)} steps completed")
         
+        await flush_reports()
+        
+        # Nothing left to run - anything still pending has unmet dependencies
+        pending = [s for s in plan if s.id not in completed_steps]
+        if pending:
+            pending_info = [
+                f"{s.id} (depends on: {s.dependencies})" 
+                for s in pending
+            ]
+            raise ExecutionError(f"Deadlock detected: {pending_info}")
+        
         return {
             "success": True,
             "context": context,
@@ -230,6 +314,7 @@ class ExecutorEngine:
         Returns:
             Dict with execution result
         """
+        progress_callback = progress_callback or _no_progress
         if step_index >= len(task.plan):
             return {"success": False, "error": "Step index out of range"}
         
@@ -239,24 +324,22 @@ class ExecutorEngine:
             result = await self.execute_step(step, task.context)
             task.context.update(result.get("context_updates", {}))
             
-            if progress_callback:
-                await progress_callback({
-                    "type": "step_complete",
-                    "step_id": step.id,
-                    "step_index": step_index,
-                    "description": step.description,
-                    "result": result
-                })
+            await progress_callback({
+                "type": "step_complete",
+                "step_id": step.id,
+                "step_index": step_index,
+                "description": step.description,
+                "result": result
+            })
             
             return {"success": True, "result": result}
             
         except Exception as e:
-            if progress_callback:
-                await progress_callback({
-                    "type": "step_failed",
-                    "step_id": step.id,
-                    "step_index": step_index,
-                    "error": str(e)
-                })
+            await progress_callback({
+                "type": "step_failed",
+                "step_id": step.id,
+                "step_index": step_index,
+                "error": str(e)
+            })
             
             return {"success": False, "error": str(e)}
@@ -3,7 +3,8 @@ Flight Monitor - Simulated flight status monitoring service
 Demonstrates autonomous agent behavior by tracking flights and triggering adjustments
 """
 import asyncio
-from typing import Dict, List, Callable, Optional
+from collections import deque
+from typing import Dict, List, Callable, Optional, Set
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
@@ -11,6 +12,18 @@ import random
 import uuid
 
 
+# Dedicated generator for the demo simulation, with its methods bound once
+_rng = random.Random()
+_choice = _rng.choice
+_randint = _rng.randint
+
+# Possible simulated delays, in minutes
+_DEMO_DELAYS = (15, 30, 45, 60, 90)
+
+# Status changes kept per tracked flight
+STATUS_HISTORY_MAXLEN = 128
+
+
 class FlightStatus(Enum):
     """Flight status types"""
     SCHEDULED = "scheduled"
@@ -24,7 +37,25 @@ class FlightStatus(Enum):
     DIVERTED = "diverted"
 
 
-@dataclass
+# Plain value strings, looked up without going through the Enum descriptor
+_STATUS_VALUE: Dict[FlightStatus, str] = {status: status.value for status in FlightStatus}
+
+# Display rows per status; the DELAYED text is filled in with the delay
+_STATUS_DISPLAY: Dict[FlightStatus, Dict] = {
+    FlightStatus.SCHEDULED: {"emoji": "📅", "text": "Scheduled", "color": "#64748B"},
+    FlightStatus.ON_TIME: {"emoji": "✅", "text": "On Time", "color": "#10B981"},
+    FlightStatus.DELAYED: {"emoji": "⚠️", "text": "Delayed", "color": "#F59E0B"},
+    FlightStatus.BOARDING: {"emoji": "🚶", "text": "Boarding", "color": "#3B82F6"},
+    FlightStatus.DEPARTED: {"emoji": "🛫", "text": "Departed", "color": "#8B5CF6"},
+    FlightStatus.IN_FLIGHT: {"emoji": "✈️", "text": "In Flight", "color": "#3B82F6"},
+    FlightStatus.LANDED: {"emoji": "🛬", "text": "Landed", "color": "#10B981"},
+    FlightStatus.CANCELLED: {"emoji": "❌", "text": "Cancelled", "color": "#EF4444"},
+    FlightStatus.DIVERTED: {"emoji": "↩️", "text": "Diverted", "color": "#F59E0B"},
+}
+_UNKNOWN_STATUS_DISPLAY = {"emoji": "❓", "text": "Unknown", "color": "#64748B"}
+
+
+@dataclass(slots=True)
 class FlightInfo:
     """Tracked flight information"""
     booking_id: str
@@ -40,9 +71,17 @@ class FlightInfo:
     terminal: str = "TBD"
     updated_departure: Optional[str] = None
     updated_arrival: Optional[str] = None
-    status_history: List[Dict] = field(default_factory=list)
+    # Most recent status changes only, so long-running flights stay bounded
+    status_history: deque = field(default_factory=lambda: deque(maxlen=STATUS_HISTORY_MAXLEN))
+    # Last to_dict() result; reset whenever the flight is updated
+    _dict_cache: Optional[Dict] = field(default=None, init=False, repr=False, compare=False)
     
     def to_dict(self) -> Dict:
+        if self._dict_cache is None:
+            self._dict_cache = self._build_dict()
+        return self._dict_cache
+    
+    def _build_dict(self) -> Dict:
         return {
             "booking_id": self.booking_id,
             "flight_number": self.flight_number,
@@ -51,7 +90,7 @@ class FlightInfo:
             "destination": self.destination,
             "scheduled_departure": self.scheduled_departure,
             "scheduled_arrival": self.scheduled_arrival,
-            "current_status": self.current_status.value,
+            "current_status": _STATUS_VALUE[self.current_status],
             "status_display": self._get_status_display(),
             "delay_minutes": self.delay_minutes,
             "gate": self.gate,
@@ -62,18 +101,11 @@ class FlightInfo:
     
     def _get_status_display(self) -> Dict:
         """Get display-friendly status with emoji and color"""
-        status_map = {
-            FlightStatus.SCHEDULED: {"emoji": "📅", "text": "Scheduled", "color": "#64748B"},
-            FlightStatus.ON_TIME: {"emoji": "✅", "text": "On Time", "color": "#10B981"},
-            FlightStatus.DELAYED: {"emoji": "⚠️", "text": f"Delayed {self.delay_minutes}min", "color": "#F59E0B"},
-            FlightStatus.BOARDING: {"emoji": "🚶", "text": "Boarding", "color": "#3B82F6"},
-            FlightStatus.DEPARTED: {"emoji": "🛫", "text": "Departed", "color": "#8B5CF6"},
-            FlightStatus.IN_FLIGHT: {"emoji": "✈️", "text": "In Flight", "color": "#3B82F6"},
-            FlightStatus.LANDED: {"emoji": "🛬", "text": "Landed", "color": "#10B981"},
-            FlightStatus.CANCELLED: {"emoji": "❌", "text": "Cancelled", "color": "#EF4444"},
-            FlightStatus.DIVERTED: {"emoji": "↩️", "text": "Diverted", "color": "#F59E0B"},
-        }
-        return status_map.get(self.current_status, {"emoji": "❓", "text": "Unknown", "color": "#64748B"})
+        row = _STATUS_DISPLAY.get(self.current_status, _UNKNOWN_STATUS_DISPLAY)
+        if self.current_status is FlightStatus.DELAYED:
+            return {**row, "text": f"Delayed {self.delay_minutes}min"}
+        # Shared row - callers only read it
+        return row
 
 
 class FlightMonitor:
@@ -85,31 +117,39 @@ class FlightMonitor:
     def __init__(self):
         self.tracked_flights: Dict[str, FlightInfo] = {}
         self.status_callbacks: List[Callable] = []
-        self.monitoring_tasks: Dict[str, asyncio.Task] = {}
+        # Opt-in subscribers for standalone delay notifications
+        self.delay_callbacks: List[Callable] = []
+        # Scheduled simulation events per booking, cancelled on stop
+        self.monitoring_tasks: Dict[str, List[asyncio.TimerHandle]] = {}
+        # Strong references to event coroutines while they run
+        self._event_tasks: Set[asyncio.Task] = set()
         self._running = False
     
     def register_callback(self, callback: Callable):
         """Register callback for status updates"""
-        self.status_callbacks.append(callback)
+        # Re-registering is a no-op so repeat callers don't get duplicate updates
+        if callback not in self.status_callbacks:
+            self.status_callbacks.append(callback)
+    
+    def register_delay_callback(self, callback: Callable):
+        """Register callback for delay notifications only"""
+        self.delay_callbacks.append(callback)
     
     def start_monitoring(self, flight: FlightInfo, simulate_delay: bool = True):
         """Start monitoring a flight"""
         self.tracked_flights[flight.booking_id] = flight
         
-        # Start simulation task
+        # Schedule simulated updates
         if simulate_delay:
-            task = asyncio.create_task(
-                self._simulate_flight_updates(flight.booking_id)
-            )
-            self.monitoring_tasks[flight.booking_id] = task
+            self.monitoring_tasks[flight.booking_id] = self._simulate_flight_updates(flight.booking_id)
         
         return flight
     
     def stop_monitoring(self, booking_id: str):
         """Stop monitoring a flight"""
         if booking_id in self.monitoring_tasks:
-            self.monitoring_tasks[booking_id].cancel()
-            del self.monitoring_tasks[booking_id]
+            for handle in self.monitoring_tasks.pop(booking_id):
+                handle.cancel()
         if booking_id in self.tracked_flights:
             del self.tracked_flights[booking_id]
     
@@ -121,49 +161,57 @@ class FlightMonitor:
         """Get all tracked flights"""
         return list(self.tracked_flights.values())
     
-    async def _simulate_flight_updates(self, booking_id: str):
+    def _simulate_flight_updates(self, booking_id: str) -> List[asyncio.TimerHandle]:
         """
         Simulate flight status changes for demo purposes.
-        This creates a realistic progression of status updates.
+        This creates a realistic progression of status updates, scheduled
+        up front on the event loop rather than as a chain of sleeps.
         """
-        try:
-            flight = self.tracked_flights.get(booking_id)
-            if not flight:
-                return
-            
-            # Wait a bit before first update
-            await asyncio.sleep(5)
-            
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        schedule = [
             # Update to "On Time" status
-            await self._update_status(booking_id, FlightStatus.ON_TIME, gate="B42")
-            
-            # Simulate potential delay (70% chance for demo)
-            await asyncio.sleep(8)
-            
-            if random.random() < 0.7:  # 70% chance of delay for demo
-                delay_minutes = random.choice([15, 30, 45, 60, 90])
-                await self._update_status(
-                    booking_id, 
-                    FlightStatus.DELAYED,
-                    delay_minutes=delay_minutes
-                )
-                
-                # Notify about delay
-                await self._notify_delay(booking_id, delay_minutes)
-            
+            (5, self._update_status, (booking_id, FlightStatus.ON_TIME, 0, "B42")),
+            # Simulate potential delay
+            (13, self._simulate_delay, (booking_id,)),
             # Continue with boarding after some time
-            await asyncio.sleep(10)
-            await self._update_status(booking_id, FlightStatus.BOARDING)
-            
+            (23, self._update_status, (booking_id, FlightStatus.BOARDING)),
             # Depart
-            await asyncio.sleep(5)
-            await self._update_status(booking_id, FlightStatus.DEPARTED)
-            
+            (28, self._update_status, (booking_id, FlightStatus.DEPARTED)),
+        ]
+        return [
+            loop.call_at(t0 + delay, self._run_event, coro_fn, args)
+            for delay, coro_fn, args in schedule
+        ]
+    
+    def _run_event(self, coro_fn: Callable, args: tuple):
+        """Start a scheduled simulation event"""
+        task = asyncio.create_task(self._guarded(coro_fn(*args)))
+        self._event_tasks.add(task)
+        task.add_done_callback(self._event_tasks.discard)
+    
+    async def _guarded(self, coro):
+        try:
+            await coro
         except asyncio.CancelledError:
             pass
         except Exception as e:
             print(f"Flight monitoring error: {e}")
     
+    async def _simulate_delay(self, booking_id: str):
+        # One draw decides both whether to delay and by how much
+        bits = _rng.getrandbits(16)
+        if (bits & 0xFF) < 179:  # ~70% chance of delay for demo
+            delay_minutes = _DEMO_DELAYS[(bits >> 8) % len(_DEMO_DELAYS)]
+            await self._update_status(
+                booking_id, 
+                FlightStatus.DELAYED,
+                delay_minutes=delay_minutes
+            )
+            
+            # Notify about delay
+            await self._notify_delay(booking_id, delay_minutes)
+    
     async def _update_status(
         self,
         booking_id: str,
@@ -176,7 +224,13 @@ class FlightMonitor:
         if not flight:
             return
         
-        old_status = flight.current_status
+        # Nothing changed - skip the history entry and broadcast
+        if flight.current_status is new_status and not delay_minutes and not gate:
+            return
+        
+        now_iso = datetime.now().isoformat()
+        old_value = _STATUS_VALUE[flight.current_status]
+        new_value = _STATUS_VALUE[new_status]
         flight.current_status = new_status
         
         if delay_minutes:
@@ -185,11 +239,13 @@ class FlightMonitor:
         if gate:
             flight.gate = gate
         
+        flight._dict_cache = None
+        
         # Record in history
         flight.status_history.append({
-            "timestamp": datetime.now().isoformat(),
-            "old_status": old_status.value,
-            "new_status": new_status.value,
+            "timestamp": now_iso,
+            "old_status": old_value,
+            "new_status": new_value,
             "delay_minutes": delay_minutes,
         })
         
@@ -199,17 +255,13 @@ class FlightMonitor:
             "booking_id": booking_id,
             "flight": flight.to_dict(),
             "change": {
-                "from": old_status.value,
-                "to": new_status.value,
+                "from": old_value,
+                "to": new_value,
                 "delay_minutes": delay_minutes,
             }
         }
         
-        for callback in self.status_callbacks:
-            try:
-                await callback(update)
-            except Exception as e:
-                print(f"Callback error: {e}")
+        await self._broadcast(self.status_callbacks, update, "Callback error")
     
     async def _notify_delay(self, booking_id: str, delay_minutes: int):
         """Send delay notification with adjustment info"""
@@ -217,21 +269,33 @@ class FlightMonitor:
         if not flight:
             return
         
-        notification = {
+        # Without dedicated subscribers, fall back to everyone tracking status
+        callbacks = self.delay_callbacks or self.status_callbacks
+        notification = self._build_delay_notification(flight, delay_minutes)
+        await self._broadcast(callbacks, notification, "Notification callback error")
+    
+    def _build_delay_notification(self, flight: FlightInfo, delay_minutes: int) -> Dict:
+        return {
             "type": "flight_delay_notification",
-            "booking_id": booking_id,
+            "booking_id": flight.booking_id,
             "flight_number": flight.flight_number,
             "delay_minutes": delay_minutes,
             "message": f"Your flight {flight.flight_number} is now delayed by {delay_minutes} minutes",
             "new_arrival": flight.updated_arrival,
             "action_taken": None,  # Will be filled by follow-up engine
         }
-        
-        for callback in self.status_callbacks:
-            try:
-                await callback(notification)
-            except Exception as e:
-                print(f"Notification callback error: {e}")
+    
+    async def _broadcast(self, callbacks: List[Callable], message: Dict, error_label: str):
+        """Send a message to callbacks concurrently; one failing doesn't stop the rest"""
+        if not callbacks:
+            return
+        results = await asyncio.gather(
+            *(callback(message) for callback in callbacks),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"{error_label}: {result}")
     
     async def trigger_demo_delay(self, booking_id: str, delay_minutes: int = 45):
         """
@@ -265,7 +329,7 @@ class FlightMonitor:
         flight_number = (
             flight_data.get("number") or 
             booking_details.get("flight_number") or
-            f"XX{random.randint(100, 999)}"
+            f"XX{_randint(100, 999)}"
         )
         
         airline = (
@@ -292,8 +356,8 @@ class FlightMonitor:
             destination=destination,
             scheduled_departure=schedule_data.get("departure", "2024-02-15 4:25 PM"),
             scheduled_arrival=schedule_data.get("arrival", "2024-02-16 7:30 PM"),
-            gate=random.choice(["A12", "B24", "C8", "D15"]),
-            terminal=f"Terminal {random.choice(['1', '2', '3', 'B'])}",
+            gate=_choice(("A12", "B24", "C8", "D15")),
+            terminal=f"Terminal {_choice(('1', '2', '3', 'B'))}",
         )
 
 
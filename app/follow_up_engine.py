@@ -2,10 +2,13 @@
 Follow-up Engine - Intelligent suggestion system for proactive agent actions
 """
 import asyncio
+from collections import ChainMap
+from string import Formatter
 from typing import Dict, List, Optional, Callable
 from dataclasses import dataclass, field
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
 import uuid
 
 
@@ -19,7 +22,11 @@ class FollowUpType(Enum):
     AIRPORT_LOUNGE = "airport_lounge"
 
 
-@dataclass
+# Plain value strings, looked up without going through the Enum descriptor
+_FOLLOW_UP_TYPE_VALUE: Dict[FollowUpType, str] = {t: t.value for t in FollowUpType}
+
+
+@dataclass(slots=True)
 class FollowUpSuggestion:
     """A proactive follow-up suggestion"""
     id: str
@@ -36,7 +43,7 @@ class FollowUpSuggestion:
     def to_dict(self) -> Dict:
         return {
             "id": self.id,
-            "type": self.type.value,
+            "type": _FOLLOW_UP_TYPE_VALUE[self.type],
             "title": self.title,
             "description": self.description,
             "emoji": self.emoji,
@@ -47,7 +54,7 @@ class FollowUpSuggestion:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class DependentBooking:
     """A booking that depends on another booking"""
     id: str
@@ -59,21 +66,78 @@ class DependentBooking:
     auto_adjust: bool = True  # Automatically adjust when parent changes
 
 
+def _build_cab_params(context: Dict) -> Dict:
+    return {
+        "pickup_location": context.get("destination_airport", context.get("destination")),
+        "pickup_time": context.get("arrival_time"),
+        "linked_booking_id": context.get("booking_id"),
+        "linked_booking_type": "flight",
+    }
+
+
+def _build_restaurant_params(context: Dict) -> Dict:
+    return {
+        "location": context.get("hotel_address", context.get("destination")),
+        "date": context.get("check_in_date"),
+        "party_size": context.get("guests", 2),
+    }
+
+
+def _build_return_flight_params(context: Dict) -> Dict:
+    return {
+        "origin": context.get("destination"),
+        "destination": context.get("origin", "LAX"),
+        "date": context.get("return_date"),
+    }
+
+
+def _empty_params(context: Dict) -> Dict:
+    return {}
+
+
+# Suggested-parameter builders per follow-up type; other types get no parameters
+_PARAM_BUILDERS: Dict[FollowUpType, Callable[[Dict], Dict]] = {
+    FollowUpType.CAB_PICKUP: _build_cab_params,
+    FollowUpType.RESTAURANT_NEARBY: _build_restaurant_params,
+    FollowUpType.RETURN_FLIGHT: _build_return_flight_params,
+}
+
+
+def _compile_rules(rules: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+    """
+    Precompile description templates to %-style strings (None when there is
+    nothing to substitute) so suggestions don't re-parse str.format templates.
+    """
+    for booking_rules in rules.values():
+        for rule in booking_rules:
+            parts = []
+            has_fields = False
+            for literal, field_name, _, _ in Formatter().parse(rule["description_template"]):
+                parts.append(literal.replace("%", "%%"))
+                if field_name is not None:
+                    parts.append(f"%({field_name})s")
+                    has_fields = True
+            rule["compiled_template"] = "".join(parts) if has_fields else None
+    return rules
+
+
 class FollowUpEngine:
     """
     Analyzes completed tasks and generates intelligent follow-up suggestions.
     Also manages dependencies between bookings.
     """
     
-    # Define what follow-ups are relevant for each booking type
-    FOLLOW_UP_RULES = {
+    # Define what follow-ups are relevant for each booking type.
+    # "requires" names a context key that must be set; "condition" is only
+    # used for checks that can't be expressed that way.
+    FOLLOW_UP_RULES = _compile_rules({
         "flight": [
             {
                 "type": FollowUpType.CAB_PICKUP,
                 "title": "Book Cab Pickup",
                 "emoji": "🚗",
                 "description_template": "Would you like me to book a cab pickup at {destination}?",
-                "condition": lambda ctx: ctx.get("destination") is not None,
+                "requires": "destination",
                 "priority": 1,
             },
             {
@@ -81,7 +145,6 @@ class FollowUpEngine:
                 "emoji": "🏨",
                 "title": "Book Hotel Near Airport",
                 "description_template": "Need a hotel near {destination} airport?",
-                "condition": lambda ctx: True,
                 "priority": 2,
             },
             {
@@ -99,7 +162,6 @@ class FollowUpEngine:
                 "emoji": "🍽️",
                 "title": "Reserve Restaurant",
                 "description_template": "Make dinner reservations near your hotel?",
-                "condition": lambda ctx: True,
                 "priority": 2,
             },
             {
@@ -107,7 +169,7 @@ class FollowUpEngine:
                 "emoji": "🚗",
                 "title": "Checkout Transportation",
                 "description_template": "Book a cab for checkout on {checkout_date}?",
-                "condition": lambda ctx: ctx.get("checkout_date") is not None,
+                "requires": "checkout_date",
                 "priority": 1,
             },
         ],
@@ -117,7 +179,6 @@ class FollowUpEngine:
                 "emoji": "⏰",
                 "title": "Set Additional Reminders",
                 "description_template": "Add more reminders for your appointment?",
-                "condition": lambda ctx: True,
                 "priority": 2,
             },
             {
@@ -125,14 +186,15 @@ class FollowUpEngine:
                 "emoji": "🚗",
                 "title": "Book Ride to Appointment",
                 "description_template": "Book a ride to {clinic_name}?",
-                "condition": lambda ctx: ctx.get("clinic_name") is not None,
+                "requires": "clinic_name",
                 "priority": 1,
             },
         ],
-    }
+    })
     
     def __init__(self):
-        self.pending_suggestions: Dict[str, List[FollowUpSuggestion]] = {}
+        # task_id -> suggestion_id -> suggestion, kept in priority order
+        self.pending_suggestions: Dict[str, Dict[str, FollowUpSuggestion]] = {}
         self.dependent_bookings: Dict[str, List[DependentBooking]] = {}
         self.suggestion_callbacks: List[Callable] = []
     
@@ -161,17 +223,27 @@ class FollowUpEngine:
         Returns:
             List of follow-up suggestions
         """
+        rules = self.FOLLOW_UP_RULES.get(booking_type, ())
+        if not rules:
+            # Nothing to suggest for this booking type
+            self.pending_suggestions[task_id] = {}
+            return []
+        
         suggestions = []
-        rules = self.FOLLOW_UP_RULES.get(booking_type, [])
         
-        # Merge booking details and context for condition checking
-        combined_context = {**context, **booking_details}
+        # Layer booking details over context for condition checking (no copy)
+        combined_context = ChainMap(booking_details, context)
         
         for rule in rules:
             # Check if condition is met
-            if rule["condition"](combined_context):
+            required = rule.get("requires")
+            if required is not None and combined_context.get(required) is None:
+                continue
+            condition = rule.get("condition")
+            if condition is None or condition(combined_context):
                 # Build the suggestion
-                description = rule["description_template"].format(**combined_context)
+                template = rule["compiled_template"]
+                description = template % combined_context if template else rule["description_template"]
                 
                 suggestion = FollowUpSuggestion(
                     id=f"followup_{uuid.uuid4().hex[:8]}",
@@ -190,62 +262,39 @@ class FollowUpEngine:
         suggestions.sort(key=lambda s: s.priority)
         
         # Store suggestions
-        self.pending_suggestions[task_id] = suggestions
+        self.pending_suggestions[task_id] = {s.id: s for s in suggestions}
         
         # Notify callbacks
-        for callback in self.suggestion_callbacks:
-            await callback(task_id, suggestions)
+        results = await asyncio.gather(
+            *(callback(task_id, suggestions) for callback in self.suggestion_callbacks),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Suggestion callback error: {result}")
         
         return suggestions
     
     def _build_parameters(self, follow_up_type: FollowUpType, context: Dict) -> Dict:
         """Build suggested parameters for a follow-up action"""
-        if follow_up_type == FollowUpType.CAB_PICKUP:
-            return {
-                "pickup_location": context.get("destination_airport", context.get("destination")),
-                "pickup_time": context.get("arrival_time"),
-                "linked_booking_id": context.get("booking_id"),
-                "linked_booking_type": "flight",
-            }
-        elif follow_up_type == FollowUpType.RESTAURANT_NEARBY:
-            return {
-                "location": context.get("hotel_address", context.get("destination")),
-                "date": context.get("check_in_date"),
-                "party_size": context.get("guests", 2),
-            }
-        elif follow_up_type == FollowUpType.RETURN_FLIGHT:
-            return {
-                "origin": context.get("destination"),
-                "destination": context.get("origin", "LAX"),
-                "date": context.get("return_date"),
-            }
-        return {}
+        return _PARAM_BUILDERS.get(follow_up_type, _empty_params)(context)
     
     def get_pending_suggestions(self, task_id: str) -> List[FollowUpSuggestion]:
         """Get pending suggestions for a task"""
-        return self.pending_suggestions.get(task_id, [])
+        return list(self.pending_suggestions.get(task_id, {}).values())
     
     def get_top_suggestion(self, task_id: str) -> Optional[FollowUpSuggestion]:
         """Get the highest priority pending suggestion"""
-        suggestions = self.pending_suggestions.get(task_id, [])
-        return suggestions[0] if suggestions else None
+        suggestions = self.pending_suggestions.get(task_id, {})
+        return next(iter(suggestions.values()), None)
     
     def accept_suggestion(self, task_id: str, suggestion_id: str) -> Optional[FollowUpSuggestion]:
         """Accept a suggestion and remove it from pending"""
-        suggestions = self.pending_suggestions.get(task_id, [])
-        for i, s in enumerate(suggestions):
-            if s.id == suggestion_id:
-                return suggestions.pop(i)
-        return None
+        return self.pending_suggestions.get(task_id, {}).pop(suggestion_id, None)
     
     def dismiss_suggestion(self, task_id: str, suggestion_id: str) -> bool:
         """Dismiss a suggestion"""
-        suggestions = self.pending_suggestions.get(task_id, [])
-        for i, s in enumerate(suggestions):
-            if s.id == suggestion_id:
-                suggestions.pop(i)
-                return True
-        return False
+        return self.pending_suggestions.get(task_id, {}).pop(suggestion_id, None) is not None
     
     def register_dependent_booking(
         self,
@@ -274,75 +323,86 @@ class FollowUpEngine:
         Returns list of adjustments made.
         """
         adjustments = []
-        dependents = self.get_dependent_bookings(parent_booking_id)
+        notifications = []
+        handler = self._CHANGE_HANDLERS.get(change_type)
+        if handler is None:
+            return adjustments
         
-        for dependent in dependents:
+        for dependent in self.get_dependent_bookings(parent_booking_id):
             if not dependent.auto_adjust:
                 continue
             
-            if change_type == "delayed":
-                # Calculate new time based on delay
-                delay_minutes = change_details.get("delay_minutes", 0)
-                new_time = self._calculate_new_time(
-                    dependent.booking_details.get("pickup_time"),
-                    delay_minutes
-                )
-                
-                adjustment = {
-                    "booking_id": dependent.id,
-                    "booking_type": dependent.type,
-                    "change": "rescheduled",
-                    "reason": f"Parent flight delayed by {delay_minutes} minutes",
-                    "new_pickup_time": new_time,
-                    "old_pickup_time": dependent.booking_details.get("pickup_time"),
-                }
-                
-                # Update the booking details
-                dependent.booking_details["pickup_time"] = new_time
-                adjustments.append(adjustment)
-                
-                # Notify about the adjustment
-                await notify_callback({
-                    "type": "booking_adjusted",
-                    "adjustment": adjustment,
-                })
-            
-            elif change_type == "cancelled":
-                adjustment = {
-                    "booking_id": dependent.id,
-                    "booking_type": dependent.type,
-                    "change": "needs_review",
-                    "reason": "Parent booking was cancelled",
-                    "action_required": True,
-                }
-                adjustments.append(adjustment)
-                
-                await notify_callback({
-                    "type": "booking_needs_review",
-                    "adjustment": adjustment,
-                })
+            notification_type, adjustment = handler(self, dependent, change_details)
+            adjustments.append(adjustment)
+            notifications.append({
+                "type": notification_type,
+                "adjustment": adjustment,
+            })
+        
+        # Notify about all adjustments at once
+        results = await asyncio.gather(
+            *(notify_callback(notification) for notification in notifications),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"Adjustment notification error: {result}")
         
         return adjustments
     
+    def _handle_delay_change(self, dependent: DependentBooking, change_details: Dict) -> tuple:
+        """Reschedule a dependent booking by the parent's delay"""
+        delay_minutes = change_details.get("delay_minutes", 0)
+        old_time = dependent.booking_details.get("pickup_time")
+        new_time = self._calculate_new_time(old_time, delay_minutes)
+        
+        # Update the booking details
+        dependent.booking_details["pickup_time"] = new_time
+        return "booking_adjusted", {
+            "booking_id": dependent.id,
+            "booking_type": dependent.type,
+            "change": "rescheduled",
+            "reason": f"Parent flight delayed by {delay_minutes} minutes",
+            "new_pickup_time": new_time,
+            "old_pickup_time": old_time,
+        }
+    
+    def _handle_cancel_change(self, dependent: DependentBooking, change_details: Dict) -> tuple:
+        """Flag a dependent booking for review after its parent was cancelled"""
+        return "booking_needs_review", {
+            "booking_id": dependent.id,
+            "booking_type": dependent.type,
+            "change": "needs_review",
+            "reason": "Parent booking was cancelled",
+            "action_required": True,
+        }
+    
+    # Parent change type -> handler returning (notification type, adjustment)
+    _CHANGE_HANDLERS = {
+        "delayed": _handle_delay_change,
+        "cancelled": _handle_cancel_change,
+    }
+    
     def _calculate_new_time(self, original_time: str, delay_minutes: int) -> str:
-        """Calculate new time after delay (simplified)"""
-        # For demo, just return a formatted string
-        # In production, parse and add minutes properly
+        """Calculate new time after delay"""
+        return _calc_new_time(original_time, delay_minutes)
+
+
+@lru_cache(maxsize=512)
+def _calc_new_time(original_time: str, delay_minutes: int) -> str:
+    """Shift a "4:25 PM" (or 24-hour "16:25") time by the delay; unparseable times get a suffix"""
+    text = str(original_time).strip()
+    for fmt in ("%I:%M %p", "%H:%M"):
         try:
-            # Simple time parsing for demo
-            if ":" in str(original_time):
-                parts = original_time.replace(" PM", "").replace(" AM", "").split(":")
-                hour = int(parts[0])
-                minute = int(parts[1]) + delay_minutes
-                hour += minute // 60
-                minute = minute % 60
-                period = "PM" if hour >= 12 else "AM"
-                if hour > 12:
-                    hour -= 12
-                return f"{hour}:{minute:02d} {period}"
-        except:
-            pass
+            parsed = datetime.strptime(text, fmt)
+            break
+        except ValueError:
+            continue
+    else:
         return f"{original_time} (+{delay_minutes}min)"
+    
+    shifted = parsed + timedelta(minutes=delay_minutes)
+    return f"{shifted.hour % 12 or 12}:{shifted.minute:02d} {'PM' if shifted.hour >= 12 else 'AM'}"
 
 
 # Global instance
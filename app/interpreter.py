@@ -1,11 +1,190 @@
 """
 Outcome Interpreter - Converts vague user goals into measurable success criteria
 """
-import json
+import asyncio
+import hashlib
 import os
-from typing import Dict, Any
+import re
+from typing import Dict, Any, Optional, Final
+
+import orjson
 
 from .models import OutcomeDefinition
+from .llm_client import ResponseCache, cache_key, stream_chat_content
+
+
+_SYSTEM_PROMPT = """You are an Outcome Interpreter for an autonomous agent system.
+
+Your job: Convert vague user goals into precise, measurable success criteria.
+
+Rules:
+1. Success criteria must be binary (yes/no verifiable)
+2. Include all implicit requirements (confirmations, notifications, etc.)
+3. Define validation method that can programmatically verify completion
+4. Extract constraints (budget, deadlines, preferences)
+5. Identify domain for tool selection
+
+Output JSON format:
+{
+    "success_criteria": ["criterion 1", "criterion 2", ...],
+    "validation_method": "description of how to verify",
+    "domain": "travel|healthcare|admin|business|research|other",
+    "constraints": {"budget": "...", "deadline": "...", "preferences": [...]},
+    "potential_risks": ["risk 1", "risk 2"],
+    "requires_human_approval_for": ["financial transactions", "legal agreements", ...]
+}"""
+
+# Routes requests sharing the system prompt to the same prompt cache
+_SYSTEM_PROMPT_HASH = hashlib.sha1(_SYSTEM_PROMPT.encode()).hexdigest()
+
+# Fixed chat completion parameters, built once instead of per call
+_LLM_PARAMS: Final[Dict[str, Any]] = {
+    "model": "gpt-4-turbo-preview",
+    "response_format": {"type": "json_object"},
+    "temperature": 0.1,
+    "extra_body": {"prompt_cache_key": _SYSTEM_PROMPT_HASH},
+}
+
+
+_BUDGET_RE = re.compile(r'\$(\d+(?:,\d+)*)')
+
+# Timeframe phrases in priority order
+_TIMEFRAMES = (
+    ('next week', 'next_week'),
+    ('this week', 'this_week'),
+    ('tomorrow', 'tomorrow'),
+    ('today', 'today'),
+)
+_TIMEFRAME_RE = re.compile("|".join(re.escape(phrase) for phrase, _ in _TIMEFRAMES))
+
+
+# Mock-mode domain keywords, in detection priority order
+_DOMAIN_KEYWORDS = (
+    ("travel", ("flight", "book", "hotel", "travel", "trip", "vacation")),
+    ("healthcare", ("appointment", "doctor", "physical", "checkup", "medical", "health")),
+    ("business", ("approval", "approve", "payment", "sign", "contract", "vendor")),
+    ("admin", ("renew", "license", "form", "apply", "document", "submit")),
+    ("research", ("research", "find", "summarize", "papers", "report", "analysis")),
+)
+_KEYWORD_DOMAIN: Dict[str, str] = {}
+for _domain, _keywords in reversed(_DOMAIN_KEYWORDS):
+    for _keyword in _keywords:
+        _KEYWORD_DOMAIN[_keyword] = _domain
+
+# Zero-width lookahead so overlapping keywords are all reported in one pass
+_DOMAIN_SCAN_RE = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for kw in sorted(_KEYWORD_DOMAIN, key=len, reverse=True)) + "))"
+)
+
+
+# Fixed parts of each mock domain's outcome; the tuples are copied into
+# fresh lists per outcome, so templates are never shared between outcomes
+_DOMAIN_TEMPLATES: Final[Dict[str, Dict[str, Any]]] = {
+    "travel": {
+        "success_criteria": (
+            "Flight/hotel booked successfully",
+            "Booking confirmation number obtained",
+            "Confirmation email received",
+            "Added to user's calendar",
+            "All travel details documented",
+        ),
+        "validation_method": "verify_booking_confirmation",
+        "domain": "travel",
+        "potential_risks": ("Price changes", "Availability issues"),
+        "requires_human_approval_for": ("payments_above_500",),
+    },
+    "healthcare": {
+        "success_criteria": (
+            "Appointment scheduled with provider",
+            "Date and time confirmed",
+            "Calendar invite sent",
+            "Reminder set",
+            "Insurance verified if needed",
+        ),
+        "validation_method": "verify_appointment_confirmation",
+        "domain": "healthcare",
+        "potential_risks": ("No available slots", "Insurance issues"),
+        "requires_human_approval_for": (),
+    },
+    "business": {
+        "success_criteria": (
+            "All required approvals obtained",
+            "Signatures collected from stakeholders",
+            "Payment processed or contract signed",
+            "Confirmation sent to all parties",
+            "Documentation archived",
+        ),
+        "validation_method": "verify_approval_completion",
+        "domain": "business",
+        "potential_risks": ("Approval delays", "Stakeholder unavailable"),
+        "requires_human_approval_for": ("all_approvals", "payments"),
+    },
+    "admin": {
+        "success_criteria": (
+            "Application/form submitted successfully",
+            "Confirmation received",
+            "Payment processed if required",
+            "Tracking number obtained",
+            "Completion documented",
+        ),
+        "validation_method": "verify_submission_confirmation",
+        "domain": "admin",
+        "potential_risks": ("Missing documents", "Processing delays"),
+        "requires_human_approval_for": ("payments",),
+    },
+    "research": {
+        "success_criteria": (
+            "Required information gathered",
+            "Sources verified and documented",
+            "Summary/report generated",
+            "Deliverable shared with user",
+            "Quality criteria met",
+        ),
+        "validation_method": "verify_deliverable_quality",
+        "domain": "research",
+        "potential_risks": ("Insufficient sources", "Information quality"),
+        "requires_human_approval_for": (),
+    },
+    "other": {
+        "success_criteria": (
+            "Task completed as requested",
+            "Results verified and documented",
+            "User notified of completion",
+        ),
+        "validation_method": "manual_verification",
+        "domain": "other",
+        "potential_risks": ("Unclear requirements",),
+        "requires_human_approval_for": (),
+    },
+}
+
+
+# Mock outcomes are built from trusted templates, so they skip validation
+_construct_outcome = OutcomeDefinition.model_construct
+
+
+# LLM responses larger than this (characters) are parsed in a worker thread
+_OFFLOAD_PARSE_CHARS = 4096
+
+
+def _build_outcome(content: str, user_input: str) -> OutcomeDefinition:
+    """Parse an LLM response into an OutcomeDefinition"""
+    parsed = orjson.loads(content)
+    
+    return OutcomeDefinition(
+        original_goal=user_input,
+        success_criteria=parsed.get("success_criteria", []),
+        validation_method=parsed.get("validation_method", "manual_verification"),
+        domain=parsed.get("domain", "other"),
+        constraints=parsed.get("constraints", {}),
+        potential_risks=parsed.get("potential_risks", []),
+        requires_human_approval_for=parsed.get("requires_human_approval_for", [])
+    )
+
+
+def _outcome_cache_key(user_input: str, user_context: Dict) -> str:
+    """Cache key for an interpretation: the normalized goal plus its context"""
+    return cache_key(" ".join(user_input.lower().split()), user_context)
 
 
 class OutcomeInterpreter:
@@ -19,6 +198,11 @@ class OutcomeInterpreter:
         # In production, this would use OpenAI or similar
         self.use_llm = os.getenv("USE_LLM", "false").lower() == "true"
         self.api_key = os.getenv("OPENAI_API_KEY", "")
+        self._cache = ResponseCache(int(os.getenv("INTERPRETER_CACHE_SIZE", "1024")))
+        # Cache key -> LLM call in progress, shared by identical concurrent goals
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Mock outcome builders for domains that need more than their template
+        self._mock_builders = {"travel": self._build_travel}
     
     async def interpret(self, user_input: str, user_context: Dict) -> OutcomeDefinition:
         """
@@ -30,212 +214,103 @@ class OutcomeInterpreter:
         """
         
         if self.use_llm and self.api_key:
-            return await self._interpret_with_llm(user_input, user_context)
+            # Repeated goals reuse the earlier interpretation and concurrent
+            # identical goals share one in-flight call instead of each calling the LLM
+            key = _outcome_cache_key(user_input, user_context)
+            outcome = self._cache.get(key)
+            if outcome is None:
+                inflight = self._inflight.get(key)
+                if inflight is None:
+                    inflight = asyncio.ensure_future(self._interpret_with_llm(user_input, user_context))
+                    self._inflight[key] = inflight
+                    inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+                try:
+                    # Shielded so one cancelled caller doesn't cancel the shared call
+                    outcome = await asyncio.shield(inflight)
+                except Exception as e:
+                    # Fallbacks aren't cached so the LLM is retried next time
+                    print(f"LLM interpretation failed: {e}, falling back to mock")
+                    return await self._interpret_mock(user_input, user_context)
+                self._cache.put(key, outcome)
+            return outcome.model_copy(update={"original_goal": user_input}, deep=True)
         else:
             return await self._interpret_mock(user_input, user_context)
     
     async def _interpret_with_llm(self, user_input: str, user_context: Dict) -> OutcomeDefinition:
-        """Use LLM to interpret the goal"""
-        try:
-            import openai
-            client = openai.AsyncOpenAI(api_key=self.api_key)
-            
-            system_prompt = """You are an Outcome Interpreter for an autonomous agent system.
-
-Your job: Convert vague user goals into precise, measurable success criteria.
-
-Rules:
-1. Success criteria must be binary (yes/no verifiable)
-2. Include all implicit requirements (confirmations, notifications, etc.)
-3. Define validation method that can programmatically verify completion
-4. Extract constraints (budget, deadlines, preferences)
-5. Identify domain for tool selection
-
-Output JSON format:
-{
-    "success_criteria": ["criterion 1", "criterion 2", ...],
-    "validation_method": "description of how to verify",
-    "domain": "travel|healthcare|admin|business|research|other",
-    "constraints": {"budget": "...", "deadline": "...", "preferences": [...]},
-    "potential_risks": ["risk 1", "risk 2"],
-    "requires_human_approval_for": ["financial transactions", "legal agreements", ...]
-}"""
-
-            response = await client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"User context: {json.dumps(user_context)}\n\nGoal: {user_input}"}
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.1
-            )
-            
-            parsed = json.loads(response.choices[0].message.content)
-            
-            return OutcomeDefinition(
-                original_goal=user_input,
-                success_criteria=parsed.get("success_criteria", []),
-                validation_method=parsed.get("validation_method", "manual_verification"),
-                domain=parsed.get("domain", "other"),
-                constraints=parsed.get("constraints", {}),
-                potential_risks=parsed.get("potential_risks", []),
-                requires_human_approval_for=parsed.get("requires_human_approval_for", [])
-            )
-        except Exception as e:
-            print(f"LLM interpretation failed: {e}, falling back to mock")
-            return await self._interpret_mock(user_input, user_context)
+        """Use LLM to interpret the goal; errors propagate to interpret()"""
+        # Times out and retries inside stream_chat_content before raising
+        content = await stream_chat_content(
+            self.api_key,
+            # Static system prompt first and per-request details last, so
+            # the provider's prompt prefix cache can reuse the shared part
+            messages=[
+                {"role": "system", "content": _SYSTEM_PROMPT},
+                {"role": "user", "content": f"User context: {orjson.dumps(user_context, default=str).decode()}\n\nGoal: {user_input}"}
+            ],
+            **_LLM_PARAMS
+        )
+        
+        # Large responses are parsed and validated off the event loop so
+        # WebSocket updates and other requests aren't held up
+        if len(content) > _OFFLOAD_PARSE_CHARS:
+            return await asyncio.to_thread(_build_outcome, content, user_input)
+        return _build_outcome(content, user_input)
     
     async def _interpret_mock(self, user_input: str, user_context: Dict) -> OutcomeDefinition:
         """Mock interpretation for demo purposes"""
         user_input_lower = user_input.lower()
         
-        # Travel domain detection
-        if any(word in user_input_lower for word in ["flight", "book", "hotel", "travel", "trip", "vacation"]):
-            # Check for missing critical info
-            missing_info = []
-            if "destination" not in user_context and not any(city in user_input_lower for city in ["tokyo", "paris", "london", "new york", "dubai"]):
-                # Simple city check for demo - in real app would use NER
-                # If we don't know where to go and input doesn't look like it has a destination
-                pass # For now assume they might be in context or just generic search
-            
-            # If input is very short, ask for details
-            if len(user_input.split()) < 4 and not user_context.get("clarification_answer"):
-                return OutcomeDefinition(
-                    original_goal=user_input,
-                    success_criteria=[],
-                    validation_method="manual",
-                    domain="travel",
-                    constraints={
-                        "needs_clarification": True,
-                        "clarification_question": "Where would you like to go and when?"
-                    }
-                )
-
-            return OutcomeDefinition(
-                original_goal=user_input,
-                success_criteria=[
-                    "Flight/hotel booked successfully",
-                    "Booking confirmation number obtained",
-                    "Confirmation email received",
-                    "Added to user's calendar",
-                    "All travel details documented"
-                ],
-                validation_method="verify_booking_confirmation",
-                domain="travel",
-                constraints=self._extract_constraints(user_input),
-                potential_risks=["Price changes", "Availability issues"],
-                requires_human_approval_for=["payments_above_500"]
-            )
+        # One scan finds every domain keyword; earlier domains win ties
+        found = {_KEYWORD_DOMAIN[kw] for kw in _DOMAIN_SCAN_RE.findall(user_input_lower)}
+        domain = next((d for d, _ in _DOMAIN_KEYWORDS if d in found), "other")
         
-        # Healthcare domain detection
-        elif any(word in user_input_lower for word in ["appointment", "doctor", "physical", "checkup", "medical", "health"]):
-            return OutcomeDefinition(
-                original_goal=user_input,
-                success_criteria=[
-                    "Appointment scheduled with provider",
-                    "Date and time confirmed",
-                    "Calendar invite sent",
-                    "Reminder set",
-                    "Insurance verified if needed"
-                ],
-                validation_method="verify_appointment_confirmation",
-                domain="healthcare",
-                constraints=self._extract_constraints(user_input),
-                potential_risks=["No available slots", "Insurance issues"],
-                requires_human_approval_for=[]
-            )
-        
-        # Business/Approval domain detection
-        elif any(word in user_input_lower for word in ["approval", "approve", "payment", "sign", "contract", "vendor"]):
-            return OutcomeDefinition(
-                original_goal=user_input,
-                success_criteria=[
-                    "All required approvals obtained",
-                    "Signatures collected from stakeholders",
-                    "Payment processed or contract signed",
-                    "Confirmation sent to all parties",
-                    "Documentation archived"
-                ],
-                validation_method="verify_approval_completion",
-                domain="business",
-                constraints=self._extract_constraints(user_input),
-                potential_risks=["Approval delays", "Stakeholder unavailable"],
-                requires_human_approval_for=["all_approvals", "payments"]
-            )
-        
-        # Admin domain detection
-        elif any(word in user_input_lower for word in ["renew", "license", "form", "apply", "document", "submit"]):
-            return OutcomeDefinition(
-                original_goal=user_input,
-                success_criteria=[
-                    "Application/form submitted successfully",
-                    "Confirmation received",
-                    "Payment processed if required",
-                    "Tracking number obtained",
-                    "Completion documented"
-                ],
-                validation_method="verify_submission_confirmation",
-                domain="admin",
-                constraints=self._extract_constraints(user_input),
-                potential_risks=["Missing documents", "Processing delays"],
-                requires_human_approval_for=["payments"]
-            )
-        
-        # Research domain detection
-        elif any(word in user_input_lower for word in ["research", "find", "summarize", "papers", "report", "analysis"]):
-            return OutcomeDefinition(
-                original_goal=user_input,
-                success_criteria=[
-                    "Required information gathered",
-                    "Sources verified and documented",
-                    "Summary/report generated",
-                    "Deliverable shared with user",
-                    "Quality criteria met"
-                ],
-                validation_method="verify_deliverable_quality",
-                domain="research",
-                constraints=self._extract_constraints(user_input),
-                potential_risks=["Insufficient sources", "Information quality"],
-                requires_human_approval_for=[]
-            )
-        
-        # Default/generic domain
-        else:
-            return OutcomeDefinition(
+        build = self._mock_builders.get(domain, self._build_from_template)
+        return build(domain, user_input, user_input_lower, user_context)
+    
+    def _build_from_template(self, domain: str, user_input: str, user_input_lower: str, user_context: Dict) -> OutcomeDefinition:
+        template = _DOMAIN_TEMPLATES[domain]
+        return _construct_outcome(
+            original_goal=user_input,
+            success_criteria=list(template["success_criteria"]),
+            validation_method=template["validation_method"],
+            domain=template["domain"],
+            constraints=self._extract_constraints(user_input, user_input_lower),
+            potential_risks=list(template["potential_risks"]),
+            requires_human_approval_for=list(template["requires_human_approval_for"])
+        )
+    
+    def _build_travel(self, domain: str, user_input: str, user_input_lower: str, user_context: Dict) -> OutcomeDefinition:
+        # If a travel request is very short, ask for details
+        if len(user_input.split()) < 4 and not user_context.get("clarification_answer"):
+            return _construct_outcome(
                 original_goal=user_input,
-                success_criteria=[
-                    "Task completed as requested",
-                    "Results verified and documented",
-                    "User notified of completion"
-                ],
-                validation_method="manual_verification",
-                domain="other",
-                constraints=self._extract_constraints(user_input),
-                potential_risks=["Unclear requirements"],
-                requires_human_approval_for=[]
+                success_criteria=[],
+                validation_method="manual",
+                domain="travel",
+                constraints={
+                    "needs_clarification": True,
+                    "clarification_question": "Where would you like to go and when?"
+                }
             )
+        return self._build_from_template(domain, user_input, user_input_lower, user_context)
     
-    def _extract_constraints(self, user_input: str) -> Dict[str, Any]:
+    def _extract_constraints(self, user_input: str, user_input_lower: Optional[str] = None) -> Dict[str, Any]:
         """Extract constraints like budget, deadline from user input"""
         constraints = {}
-        user_input_lower = user_input.lower()
+        # Callers that already lowercased the input pass it to avoid a second copy
+        user_input_lower = user_input_lower or user_input.lower()
         
         # Extract budget
-        import re
-        budget_match = re.search(r'\$(\d+(?:,\d+)*)', user_input)
+        budget_match = _BUDGET_RE.search(user_input)
         if budget_match:
             constraints['budget'] = int(budget_match.group(1).replace(',', ''))
         
-        # Extract time constraints
-        if 'next week' in user_input_lower:
-            constraints['timeframe'] = 'next_week'
-        elif 'this week' in user_input_lower:
-            constraints['timeframe'] = 'this_week'
-        elif 'tomorrow' in user_input_lower:
-            constraints['timeframe'] = 'tomorrow'
-        elif 'today' in user_input_lower:
-            constraints['timeframe'] = 'today'
+        # Extract time constraints (one scan; earlier entries win when several match)
+        found = set(_TIMEFRAME_RE.findall(user_input_lower))
+        for phrase, timeframe in _TIMEFRAMES:
+            if phrase in found:
+                constraints['timeframe'] = timeframe
+                break
         
         # Extract deadline
         if 'before' in user_input_lower:
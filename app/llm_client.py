@@ -0,0 +1,155 @@
+"""
+LLM Client - Shared OpenAI client and concurrency limit for LLM calls
+"""
+import asyncio
+import hashlib
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+
+import orjson
+
+# Maximum LLM requests in flight at once across the process
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Per-attempt time budget (seconds) and retries after a timeout or API error.
+# The short budget suits small responses (interpretation, embeddings); full
+# plan generation and validation pass LLM_LONG_TIMEOUT_S instead
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "8"))
+LLM_LONG_TIMEOUT_S = float(os.getenv("LLM_LONG_TIMEOUT_S", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Seconds a cached LLM interpretation or plan is reused before asking again
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", "3600"))
+
+# Clients by API key; each holds one pooled httpx connection pool
+_clients: Dict[str, Any] = {}
+_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+def get_client(api_key: str):
+    """
+    Return the shared AsyncOpenAI client for an API key, creating it on
+    first use so connections and TLS sessions are reused across requests.
+    """
+    client = _clients.get(api_key)
+    if client is None:
+        import httpx
+        import openai
+        client = openai.AsyncOpenAI(
+            api_key=api_key,
+            # Retries are handled in chat_completion under our own time budget
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                # Attempts are time-boxed by _with_retries; this only has to
+                # outlast the longest of those budgets
+                timeout=httpx.Timeout(LLM_LONG_TIMEOUT_S, connect=3.0)
+            )
+        )
+        _clients[api_key] = client
+    return client
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable key for a ResponseCache, independent of dict ordering"""
+    return hashlib.sha1(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+
+
+class ResponseCache:
+    """Bounded LRU of LLM results; entries expire after LLM_CACHE_TTL_S"""
+    
+    def __init__(self, maxsize: int, ttl: float = LLM_CACHE_TTL_S):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+    
+    def put(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+async def close_clients():
+    """Close the shared clients and their connection pools (at shutdown)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.close()
+
+
+async def _with_retries(request: Callable[[], Awaitable], timeout: float = LLM_TIMEOUT_S):
+    """
+    Run an LLM request once a slot is free.
+    
+    Each attempt is cut off after `timeout` seconds so a slow provider tail
+    doesn't stall the task; timeouts and API errors are retried with exponential
+    backoff, and the last error is raised for the caller's fallback.
+    """
+    import openai
+    
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            async with _semaphore:
+                return await asyncio.wait_for(request(), timeout=timeout)
+        except (asyncio.TimeoutError, openai.APIError) as e:
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            delay = 0.25 * 2 ** attempt
+            print(f"LLM call failed ({type(e).__name__}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+
+async def chat_completion(api_key: str, timeout: float = LLM_TIMEOUT_S, **params):
+    """Create a chat completion on the shared client, `timeout` seconds per attempt"""
+    client = get_client(api_key)
+    return await _with_retries(lambda: client.chat.completions.create(**params), timeout)
+
+
+async def stream_chat_content(api_key: str, timeout: float = LLM_TIMEOUT_S, **params) -> str:
+    """
+    Stream a chat completion and return the message content, so chunks are
+    decoded as they arrive rather than in one response body at the end.
+    """
+    client = get_client(api_key)
+    
+    async def collect() -> str:
+        stream = await client.chat.completions.create(stream=True, **params)
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return "".join(parts)
+    
+    return await _with_retries(collect, timeout)
+
+
+# Embedding vectors by (model, text); recurring goals are embedded once
+_embeddings = ResponseCache(4096)
+
+
+async def embed(api_key: str, text: str, model: str = "text-embedding-3-small") -> List[float]:
+    """Embedding of a text, unit-normalized so a dot product gives the cosine"""
+    key = cache_key(model, text)
+    vector = _embeddings.get(key)
+    if vector is None:
+        client = get_client(api_key)
+        response = await _with_retries(lambda: client.embeddings.create(model=model, input=text))
+        raw = response.data[0].embedding
+        norm = math.sqrt(sum(v * v for v in raw)) or 1.0
+        vector = [v / norm for v in raw]
+        _embeddings.put(key, vector)
+    return vector
@@ -1,21 +1,35 @@
 """
 FastAPI Application - REST API and WebSocket for Autonomous Agent
 """
-import json
+import os
+import time
 import asyncio
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from contextlib import asynccontextmanager
+import orjson
 
 from .models import TaskStatus
 from .orchestrator import orchestrator
 from .state_manager import state_manager
 from .follow_up_engine import follow_up_engine, FollowUpSuggestion, DependentBooking
 from .flight_monitor import flight_monitor, FlightInfo
+from .llm_client import close_clients
+
+# Use uvloop's faster event loop where it's installed (POSIX only; listed in
+# requirements.txt and also pulled in by uvicorn[standard]). uvicorn's default
+# loop="auto" picks it up as well; this covers other ways of starting the app,
+# so the orchestrator's background tasks always run on it.
+try:
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+except ImportError:
+    pass
 
 
 # Request/Response Models
@@ -35,45 +49,110 @@ class UserInterruptionResponse(BaseModel):
     response: Dict[str, Any]
 
 
+def _ws_json(message: Dict) -> str:
+    """Encode a WebSocket message with orjson (sent as a text frame for browser clients)"""
+    return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
 # WebSocket connection manager
 class ConnectionManager:
+    """
+    Tracks WebSocket connections per task. Each connection has a bounded
+    send queue drained by its own writer task, so a slow client never
+    holds up updates to the others.
+    """
+    
+    # Messages buffered per connection before the oldest are dropped
+    QUEUE_SIZE = 256
+    # Updates arriving within this window are sent together, up to BATCH_MAX
+    BATCH_SECONDS = int(os.getenv("WS_BATCH_MS", "50")) / 1000
+    BATCH_MAX = int(os.getenv("WS_BATCH_MAX", "32"))
+    
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.writers: Dict[str, asyncio.Task] = {}
+        # Snapshot of the queues for broadcast, rebuilt on connect/disconnect
+        self._broadcast_queues: tuple = ()
     
     async def connect(self, websocket: WebSocket, task_id: str):
         await websocket.accept()
+        if task_id in self.writers:
+            # A reconnect replaces the previous socket's writer
+            self.writers.pop(task_id).cancel()
         self.active_connections[task_id] = websocket
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.queues[task_id] = queue
+        self.writers[task_id] = asyncio.create_task(self._writer(task_id, websocket, queue))
+        self._broadcast_queues = tuple(self.queues.values())
         print(f"WebSocket connected for task: {task_id}")
     
-    def disconnect(self, task_id: str):
-        if task_id in self.active_connections:
-            del self.active_connections[task_id]
-            print(f"WebSocket disconnected for task: {task_id}")
-    
-    async def send_update(self, task_id: str, message: Dict):
-        if task_id in self.active_connections:
+    def disconnect(self, task_id: str, websocket: Optional[WebSocket] = None):
+        current = self.active_connections.get(task_id)
+        if current is None or (websocket is not None and current is not websocket):
+            # Already gone, or replaced by a newer connection for this task
+            return
+        del self.active_connections[task_id]
+        self.queues.pop(task_id, None)
+        writer = self.writers.pop(task_id, None)
+        if writer:
+            writer.cancel()
+        self._broadcast_queues = tuple(self.queues.values())
+        print(f"WebSocket disconnected for task: {task_id}")
+    
+    async def _writer(self, task_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """
+        Send queued updates, coalescing bursts: after the first update, wait
+        BATCH_SECONDS and send everything queued meanwhile as one
+        {"type": "batch", "events": [...]} frame. Lone updates go out as-is.
+        """
+        while True:
+            events = [await queue.get()]
+            if self.BATCH_SECONDS > 0:
+                await asyncio.sleep(self.BATCH_SECONDS)
+            while len(events) < self.BATCH_MAX and not queue.empty():
+                events.append(queue.get_nowait())
+            message = events[0] if len(events) == 1 else {"type": "batch", "events": events}
             try:
-                await self.active_connections[task_id].send_json(message)
+                await websocket.send_text(_ws_json(message))
             except Exception as e:
-                print(f"Error sending WebSocket message: {e}")
+                print(f"Error sending WebSocket message to {task_id}: {e}")
+    
+    @staticmethod
+    def _enqueue(queue: asyncio.Queue, message: Dict):
+        if queue.full():
+            # Drop the oldest update rather than block the sender
+            queue.get_nowait()
+        queue.put_nowait(message)
+    
+    def queue_update(self, task_id: str, message: Dict):
+        queue = self.queues.get(task_id)
+        if queue is not None:
+            self._enqueue(queue, message)
+    
+    async def send_update(self, task_id: str, message: Dict):
+        self.queue_update(task_id, message)
     
     async def broadcast(self, message: Dict):
-        for task_id, connection in self.active_connections.items():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting to {task_id}: {e}")
+        for queue in self._broadcast_queues:
+            self._enqueue(queue, message)
 
 
 manager = ConnectionManager()
 
 
-# Progress callback for WebSocket updates
-async def websocket_progress_callback(update: Dict):
+# Progress callback for WebSocket updates (plain function: queueing the
+# update doesn't block, so the orchestrator calls it without scheduling a task)
+def websocket_progress_callback(update: Dict):
     """Send progress updates via WebSocket"""
     task_id = update.get("task_id")
     if task_id:
-        await manager.send_update(task_id, update)
+        manager.queue_update(task_id, update)
+
+
+# Forwards flight monitor updates to all WebSocket clients
+async def flight_ws_callback(update):
+    await manager.broadcast(update)
 
 
 # Lifespan context manager
@@ -84,9 +163,12 @@ async def lifespan(app: FastAPI):
     print("="*60)
     print("AUTONOMOUS AGENT API STARTING")
     print("="*60)
+    # One callback routes every task's progress to its WebSocket by task_id
+    orchestrator.set_global_progress_callback(websocket_progress_callback)
     yield
     # Shutdown
     print("\nShutting down...")
+    await close_clients()
 
 
 # Create FastAPI app
@@ -94,7 +176,8 @@ app = FastAPI(
     title="Autonomous Agent API",
     description="Outcome-driven autonomous AI agent system",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -140,9 +223,6 @@ async def create_task(request: CreateTaskRequest):
             context=request.context
         )
         
-        # Register WebSocket callback
-        orchestrator.register_progress_callback(task_id, websocket_progress_callback)
-        
         return TaskResponse(
             task_id=task_id,
             status="pending",
@@ -243,6 +323,14 @@ async def get_task_result(task_id: str):
             detail=f"Task not completed. Current status: {task['status']}"
         )
     
+    execution_time = task.get("execution_time_seconds")
+    if execution_time is None and task.get("completed_at"):
+        # Tasks saved before the duration was recorded at completion
+        execution_time = (
+            datetime.fromisoformat(task["completed_at"]) - 
+            datetime.fromisoformat(task["created_at"])
+        ).total_seconds()
+    
     return {
         "task_id": task_id,
         "status": "completed",
@@ -250,10 +338,7 @@ async def get_task_result(task_id: str):
         "result_summary": task.get("context", {}).get("final_result"),
         "validation": task.get("context", {}).get("validation_result"),
         "completed_at": task.get("completed_at"),
-        "execution_time_seconds": (
-            datetime.fromisoformat(task["completed_at"]) - 
-            datetime.fromisoformat(task["created_at"])
-        ).total_seconds() if task.get("completed_at") else None
+        "execution_time_seconds": execution_time
     }
 
 
@@ -280,9 +365,6 @@ async def task_websocket(websocket: WebSocket, task_id: str):
     """
     await manager.connect(websocket, task_id)
     
-    # Register this WebSocket for progress updates
-    orchestrator.register_progress_callback(task_id, websocket_progress_callback)
-    
     try:
         while True:
             # Receive client messages (ping/keepalive)
@@ -294,16 +376,28 @@ async def task_websocket(websocket: WebSocket, task_id: str):
                 # Send current status
                 task = await orchestrator.get_task_status(task_id)
                 if task:
-                    await websocket.send_json({
+                    await websocket.send_text(_ws_json({
                         "type": "status",
                         "data": task
-                    })
+                    }))
             
     except WebSocketDisconnect:
-        manager.disconnect(task_id)
+        manager.disconnect(task_id, websocket)
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(task_id)
+        manager.disconnect(task_id, websocket)
+
+
+# Health check timestamp as (epoch second, ISO string), refreshed once a second
+_health_timestamp = (0, "")
+
+
+def _health_check_timestamp() -> str:
+    global _health_timestamp
+    now = int(time.time())
+    if _health_timestamp[0] != now:
+        _health_timestamp = (now, datetime.utcfromtimestamp(now).isoformat())
+    return _health_timestamp[1]
 
 
 # Health check
@@ -313,7 +407,7 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "autonomous-agent-api",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": _health_check_timestamp(),
         "components": {
             "orchestrator": "active",
             "state_manager": "active"
@@ -407,9 +501,6 @@ async def accept_follow_up(task_id: str, request: AcceptFollowUpRequest):
         }
     )
     
-    # Register WebSocket callback
-    orchestrator.register_progress_callback(new_task, websocket_progress_callback)
-    
     return {
         "success": True,
         "new_task_id": new_task,
@@ -495,11 +586,8 @@ async def start_flight_monitoring(task_id: str):
     # Start monitoring with simulation
     flight_monitor.start_monitoring(flight_info, simulate_delay=True)
     
-    # Register callback to forward updates via WebSocket
-    async def ws_callback(update):
-        await manager.broadcast(update)
-    
-    flight_monitor.register_callback(ws_callback)
+    # Forward updates via WebSocket (registered once, however many flights)
+    flight_monitor.register_callback(flight_ws_callback)
     
     return {
         "success": True,
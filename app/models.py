@@ -3,7 +3,7 @@ Core data models for the Autonomous Agent System
 """
 from enum import Enum
 from typing import List, Dict, Optional, Any, Callable
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, TypeAdapter
 from datetime import datetime
 from uuid import uuid4
 
@@ -33,6 +33,9 @@ class StepStatus(str, Enum):
 
 class OutcomeDefinition(BaseModel):
     """Clear definition of what 'done' looks like"""
+    # Fixed once interpreted; changes go through model_copy(update=...)
+    model_config = ConfigDict(frozen=True)
+
     original_goal: str
     success_criteria: List[str]
     validation_method: str
@@ -59,6 +62,28 @@ class ExecutionStep(BaseModel):
     completed_at: Optional[datetime] = None
 
 
+class PlannedStep(BaseModel):
+    """Step as the LLM planner returns it, in the planner's short-key schema"""
+    description: str = Field(alias="d")
+    action_type: str = Field(alias="a")
+    parameters: Dict[str, Any] = Field(default_factory=dict, alias="p")
+    # Indexes of earlier steps in the same plan
+    dependencies: List[int] = Field(default_factory=list, alias="x")
+    max_retries: int = Field(default=3, alias="r")
+
+
+class PlanResponse(BaseModel):
+    """LLM planner response, parsed and validated straight from the JSON text"""
+    steps: List[PlannedStep] = Field(default_factory=list, alias="s")
+
+
+# Dumped separately by TaskState.to_dict so they can be cached
+_TO_DICT_EXCLUDE = {"outcome", "history"}
+
+# Serializes one history entry the way model_dump(mode="json") would
+_HISTORY_ENTRY = TypeAdapter(Dict[str, Any])
+
+
 class TaskState(BaseModel):
     """Full state of a task execution"""
     task_id: str = Field(default_factory=lambda: str(uuid4()))
@@ -72,26 +97,46 @@ class TaskState(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
+    # Set at completion; kept out of context, which validation and follow-ups see
+    execution_time_seconds: Optional[float] = None
     interrupt_reason: Optional[str] = None
     interrupt_data: Optional[Dict] = None
+    # (outcome, dumped outcome) - the outcome doesn't change once interpreted,
+    # so it is dumped once per outcome rather than on every save and poll
+    _outcome_dump: Optional[tuple] = PrivateAttr(default=None)
+    # (history list, dumped entries) - history is append-only, so each save
+    # only dumps the entries added since the last one
+    _history_dump: Optional[tuple] = PrivateAttr(default=None)
+    # (outcome, serialized context evidence, history length, validation result)
+    # from the last validation, reused when a replan leaves all of them unchanged
+    _validation: Optional[tuple] = PrivateAttr(default=None)
+
+    def _dump_outcome(self) -> Optional[Dict]:
+        if self.outcome is None:
+            return None
+        cached = self._outcome_dump
+        if cached is None or cached[0] is not self.outcome:
+            cached = (self.outcome, self.outcome.model_dump(mode="json"))
+            self._outcome_dump = cached
+        return cached[1]
+
+    def _dump_history(self) -> List[Dict]:
+        cached = self._history_dump
+        if cached is None or cached[0] is not self.history or len(cached[1]) > len(self.history):
+            cached = (self.history, [])
+            self._history_dump = cached
+        dumped = cached[1]
+        for entry in self.history[len(dumped):]:
+            dumped.append(_HISTORY_ENTRY.dump_python(entry, mode="json"))
+        return list(dumped)
 
     def to_dict(self) -> Dict:
         """Convert to dictionary for JSON serialization"""
-        return {
-            "task_id": self.task_id,
-            "user_id": self.user_id,
-            "status": self.status.value,
-            "outcome": self.outcome.dict() if self.outcome else None,
-            "plan": [step.dict() for step in self.plan],
-            "current_step_index": self.current_step_index,
-            "context": self.context,
-            "history": self.history,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
-            "interrupt_reason": self.interrupt_reason,
-            "interrupt_data": self.interrupt_data
-        }
+        # pydantic's serializer handles the nested steps, enums and datetimes
+        data = self.model_dump(mode="json", exclude=_TO_DICT_EXCLUDE)
+        data["outcome"] = self._dump_outcome()
+        data["history"] = self._dump_history()
+        return data
 
 
 class HumanInterruptionRequired(Exception):
@@ -119,20 +164,27 @@ class TaskNotFoundError(Exception):
 
 # Valid state transitions
 STATE_TRANSITIONS = {
-    TaskStatus.PENDING: [TaskStatus.ANALYZING],
-    TaskStatus.ANALYZING: [TaskStatus.PLANNING, TaskStatus.INTERRUPTED, TaskStatus.FAILED],
-    TaskStatus.PLANNING: [TaskStatus.EXECUTING, TaskStatus.INTERRUPTED, TaskStatus.FAILED],
-    TaskStatus.EXECUTING: [TaskStatus.WAITING, TaskStatus.RETRYING, TaskStatus.VALIDATING, 
-                           TaskStatus.INTERRUPTED, TaskStatus.FAILED],
-    TaskStatus.WAITING: [TaskStatus.EXECUTING, TaskStatus.INTERRUPTED],
-    TaskStatus.RETRYING: [TaskStatus.EXECUTING, TaskStatus.FAILED],
-    TaskStatus.INTERRUPTED: [TaskStatus.EXECUTING, TaskStatus.FAILED],
-    TaskStatus.VALIDATING: [TaskStatus.COMPLETED, TaskStatus.EXECUTING, TaskStatus.FAILED],
+    TaskStatus.PENDING: frozenset({TaskStatus.ANALYZING}),
+    TaskStatus.ANALYZING: frozenset({TaskStatus.PLANNING, TaskStatus.INTERRUPTED, TaskStatus.FAILED}),
+    TaskStatus.PLANNING: frozenset({TaskStatus.EXECUTING, TaskStatus.INTERRUPTED, TaskStatus.FAILED}),
+    TaskStatus.EXECUTING: frozenset({TaskStatus.WAITING, TaskStatus.RETRYING, TaskStatus.VALIDATING,
+                                     TaskStatus.INTERRUPTED, TaskStatus.FAILED}),
+    TaskStatus.WAITING: frozenset({TaskStatus.EXECUTING, TaskStatus.INTERRUPTED}),
+    TaskStatus.RETRYING: frozenset({TaskStatus.EXECUTING, TaskStatus.FAILED}),
+    TaskStatus.INTERRUPTED: frozenset({TaskStatus.EXECUTING, TaskStatus.FAILED}),
+    TaskStatus.VALIDATING: frozenset({TaskStatus.COMPLETED, TaskStatus.EXECUTING, TaskStatus.FAILED}),
 }
 
+# Every allowed (from, to) pair, so a transition check is a single set lookup
+ALLOWED_TRANSITIONS = frozenset(
+    (old, new) for old, targets in STATE_TRANSITIONS.items() for new in targets
+)
+
 
 class VerificationResult(BaseModel):
     """Result of completion verification"""
+    model_config = ConfigDict(frozen=True)
+
     completed: bool
     confidence: float
     criteria_results: List[Dict] = Field(default_factory=list)
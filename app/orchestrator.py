@@ -3,12 +3,23 @@ Agent Orchestrator - Main coordination engine for the autonomous agent
 Production-level with comprehensive error handling and state management
 """
 import asyncio
+import atexit
+import copy
+import inspect
+import logging
+import os
+import queue
+import sys
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Dict, Any, Optional, Callable
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import orjson
 
 from .models import (
     TaskState, TaskStatus, OutcomeDefinition, ExecutionStep,
-    HumanInterruptionRequired, StateTransitionError, STATE_TRANSITIONS
+    HumanInterruptionRequired, StateTransitionError, ALLOWED_TRANSITIONS
 )
 from .state_manager import state_manager
 from .interpreter import OutcomeInterpreter
@@ -19,6 +30,77 @@ from .validator import CompletionValidator
 from .tools import tool_registry
 
 
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves exception formatting to the listener thread.
+    
+    The stock handler formats the whole record, traceback included, before
+    queueing it. The queue here is in-process, so only the message is merged
+    up front (its args may change later) and the traceback is rendered by the
+    listener, off the event loop.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+# Log records are queued and written to stdout by a background thread, so
+# the event loop never blocks on console output
+log = logging.getLogger(__name__)
+log.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+log.propagate = False
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+log.addHandler(_DeferredQueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+def _travel_summary(context: Dict) -> Dict:
+    return {
+        "confirmation_number": context.get("confirmation_number"),
+        "flight_details": context.get("confirmation_details"),
+        "amount_paid": context.get("amount_paid"),
+        "calendar_updated": context.get("calendar_updated", False)
+    }
+
+
+def _healthcare_summary(context: Dict) -> Dict:
+    details = context.get("appointment_details")
+    return {
+        "appointment_id": context.get("appointment_id"),
+        "appointment_details": details,
+        "provider": details.get("provider") if details else None
+    }
+
+
+def _business_summary(context: Dict) -> Dict:
+    return {
+        "approvals_obtained": context.get("approvals_obtained", True),
+        "final_action": context.get("final_action", "completed")
+    }
+
+
+# Updates buffered per async progress callback before the oldest are dropped
+CALLBACK_QUEUE_SIZE = 256
+
+# (task_id, callback list) of the task an asyncio task is processing, bound
+# once per run so broadcasts read it without looking the task up
+_task_callbacks: ContextVar[Optional[Tuple[str, List[Tuple[Callable, bool]]]]] = ContextVar(
+    "task_callbacks", default=None
+)
+
+# Domain-specific result summary fields; other domains add none
+_DOMAIN_SUMMARIES: Dict[str, Callable[[Dict], Dict]] = {
+    "travel": _travel_summary,
+    "healthcare": _healthcare_summary,
+    "business": _business_summary,
+}
+
+
 class AgentOrchestrator:
     """
     Main orchestrator that coordinates all components.
@@ -34,7 +116,13 @@ class AgentOrchestrator:
         self.validator = CompletionValidator()
         
         # Progress callbacks
-        self.progress_callbacks: Dict[str, Callable] = {}
+        # Callbacks are stored as (callback, is_async), checked once at registration
+        self.progress_callbacks: Dict[str, List[Tuple[Callable, bool]]] = {}
+        # Receives updates for every task without a callback of its own
+        self.global_progress_callback: Optional[Tuple[Callable, bool]] = None
+        # Update queue and sender task per async callback, keyed by
+        # (task_id, callback); the global callback uses a task_id of None
+        self._callback_senders: Dict[Tuple[Optional[str], Callable], Tuple[asyncio.Queue, asyncio.Task]] = {}
     
     async def create_task(self, user_id: str, goal: str, context: Dict = None) -> str:
         """
@@ -65,33 +153,34 @@ class AgentOrchestrator:
         await state_manager.save_state(task)
         
         # Start processing in background
-        asyncio.create_task(self._process_task(task.task_id))
+        asyncio.create_task(self._process_task(task.task_id, task))
         
         return task.task_id
     
-    async def _process_task(self, task_id: str):
+    async def _process_task(self, task_id: str, task: Optional[TaskState] = None):
         """
         Main processing loop for a task.
         Implements the state machine.
+        
+        Callers that already hold the task pass it to skip reloading it.
         """
-        task = await state_manager.load_state(task_id)
+        task = task or await state_manager.load_state(task_id)
         if not task:
-            print(f"Task {task_id} not found")
+            log.warning("Task %s not found", task_id)
             return
         
+        self._bind_callbacks(task_id)
         try:
-            print(f"\n{'='*60}")
-            print(f"Processing task: {task_id}")
-            print(f"Goal: {task.context.get('goal', 'Unknown')}")
-            print(f"{'='*60}\n")
+            log.info("Processing task %s - goal: %s", task_id, task.context.get('goal', 'Unknown'))
             
             # State: ANALYZING
             await self._transition_state(task, TaskStatus.ANALYZING)
-            await self._broadcast_update(task, {"type": "status_change", "status": "analyzing"})
             
-            task.outcome = await self.interpreter.interpret(
-                task.context["goal"],
-                task.context
+            # The status broadcast doesn't depend on the interpretation,
+            # so it goes out while the goal is being interpreted
+            task.outcome, _ = await asyncio.gather(
+                self.interpreter.interpret(task.context["goal"], task.context),
+                self._broadcast_update(task, {"type": "status_change", "status": "analyzing"}, now=task.updated_at)
             )
             
             # Check if clarification is needed
@@ -99,24 +188,26 @@ class AgentOrchestrator:
                 await self._request_clarification(task, task.outcome.constraints.get("clarification_question"))
                 return
             
-            print(f"Outcome interpreted:")
-            print(f"  Domain: {task.outcome.domain}")
-            print(f"  Success criteria: {task.outcome.success_criteria}")
+            log.info("Outcome interpreted - domain: %s, success criteria: %s",
+                     task.outcome.domain, task.outcome.success_criteria)
             await state_manager.save_state(task)
             
             # State: PLANNING
             await self._transition_state(task, TaskStatus.PLANNING)
-            await self._broadcast_update(task, {"type": "status_change", "status": "planning"})
             
-            task.plan = await self.planner.create_plan(task.outcome, task.context)
-            print(f"Plan generated with {len(task.plan)} steps")
-            for i, step in enumerate(task.plan):
-                print(f"  {i+1}. {step.description}")
+            task.plan, _ = await asyncio.gather(
+                self.planner.create_plan(task.outcome, task.context),
+                self._broadcast_update(task, {"type": "status_change", "status": "planning"}, now=task.updated_at)
+            )
+            log.info("Plan generated with %d steps", len(task.plan))
+            if log.isEnabledFor(logging.DEBUG):
+                for i, step in enumerate(task.plan):
+                    log.debug("  %d. %s", i + 1, step.description)
             await state_manager.save_state(task)
             
             # State: EXECUTING
             await self._transition_state(task, TaskStatus.EXECUTING)
-            await self._broadcast_update(task, {"type": "status_change", "status": "executing"})
+            await self._broadcast_update(task, {"type": "status_change", "status": "executing"}, now=task.updated_at)
             
             # Execute the plan
             await self._execute_plan(task)
@@ -125,13 +216,11 @@ class AgentOrchestrator:
             await self._handle_interruption(task, e)
             
         except StateTransitionError as e:
-            print(f"\nState transition error: {e}")
+            log.error("State transition error: %s", e)
             await self._notify_failure(task, str(e))
             
         except Exception as e:
-            print(f"\nTask failed with error: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Task failed with error: %s", e)
             
             try:
                 await self._transition_state(task, TaskStatus.FAILED)
@@ -141,109 +230,164 @@ class AgentOrchestrator:
             await self._notify_failure(task, str(e))
         
         finally:
+            self._release_callbacks(task_id)
             await state_manager.save_state(task)
     
     async def _execute_plan(self, task: TaskState):
         """
-        Execute the task plan from current step index.
+        Execute the task plan from current step index, then validate.
+        Replans that add steps loop here rather than recursing, so the
+        coroutine chain stays the same depth however often validation fails.
+        """
+        while True:
+            await self._execute_steps(task)
+            
+            # All steps completed - validate
+            if not await self._validate_and_complete(task):
+                break
+    
+    async def _execute_steps(self, task: TaskState):
+        """
+        Execute plan steps from current step index until none remain.
         Handles interruptions and failures gracefully.
+        
+        current_step_index is kept on the first step that hasn't completed,
+        so each wave starts there without re-checking finished steps.
         """
+        self._skip_completed_steps(task)
         while task.current_step_index < len(task.plan):
             step_idx = task.current_step_index
-            step = task.plan[step_idx]
-            
-            # Skip already completed steps
-            if step.status.value == "completed":
-                task.current_step_index += 1
-                continue
             
-            print(f"\n--- Step {step_idx + 1}/{len(task.plan)} ---")
-            print(f"Description: {step.description}")
-            print(f"Action: {step.action_type}")
+            wave = self._parallel_wave(task, step_idx)
+            for i in wave:
+                log.info("Step %d/%d: %s (action: %s)", i + 1, len(task.plan),
+                         task.plan[i].description, task.plan[i].action_type)
             
-            try:
-                # Execute with retry
-                result = await self.retry_engine.execute_with_retry(
-                    step,
+            # Execute with retry; independent steps in the wave run concurrently
+            results = await asyncio.gather(*(
+                self.retry_engine.execute_with_retry(
+                    task.plan[i],
                     self.executor.execute_step,
                     task.context
                 )
+                for i in wave
+            ), return_exceptions=True)
+            
+            # Record every step that succeeded, in plan order, before acting on
+            # the first one that didn't - finished work isn't thrown away
+            for i, result in zip(wave, results):
+                if isinstance(result, dict) and result["success"]:
+                    await self._record_step_success(task, i, result)
+            
+            for i, result in zip(wave, results):
+                if isinstance(result, BaseException):
+                    # Includes HumanInterruptionRequired, handled by the caller
+                    raise result
                 
                 if result["success"]:
-                    # Update context with results
-                    task.context.update(result["result"].get("context_updates", {}))
-                    task.history.append({
-                        "step": step_idx,
-                        "action": step.action_type,
-                        "result": "success",
-                        "timestamp": datetime.utcnow().isoformat()
-                    })
-                    
-                    # Broadcast progress
-                    await self._broadcast_update(task, {
-                        "type": "step_complete",
-                        "step": step_idx + 1,
-                        "total_steps": len(task.plan),
-                        "description": step.description
-                    })
-                    
-                    # Move to next step
-                    task.current_step_index += 1
-                    await state_manager.save_state(task)
+                    # Move past this step (written to disk in batches; the
+                    # finally block in _process_task saves the final state)
+                    task.current_step_index = i + 1
+                    await state_manager.mark_dirty(task)
+                    continue
                     
-                elif result.get("needs_replan"):
+                if result.get("needs_replan"):
                     # Replan from this point
-                    print(f"Step needs replanning, generating alternative plan...")
-                    new_plan = await self.planner.replan(task, step_idx, result["error"])
+                    log.info("Step needs replanning, generating alternative plan...")
+                    new_plan = await self.planner.replan(task, i, result["error"])
                     task.plan = new_plan
                     await state_manager.save_state(task)
-                    continue
                     
                 elif result.get("exhausted"):
                     # All retries exhausted
-                    raise Exception(f"Step {step_idx + 1} exhausted all retries: {result.get('error', 'Unknown error')}")
-                    
-            except HumanInterruptionRequired as e:
-                # Re-raise to be handled by caller
-                raise
+                    raise Exception(f"Step {i + 1} exhausted all retries: {result.get('error', 'Unknown error')}")
+                break
+            
+            self._skip_completed_steps(task)
+    
+    def _skip_completed_steps(self, task: TaskState):
+        """Advance current_step_index past any steps that already completed."""
+        plan = task.plan
+        idx = task.current_step_index
+        while idx < len(plan) and plan[idx].status is StepStatus.COMPLETED:
+            idx += 1
+        task.current_step_index = idx
+    
+    def _parallel_wave(self, task: TaskState, start: int) -> List[int]:
+        """
+        Indexes of the steps to run together from `start`: the step at `start`
+        plus the following steps whose declared dependencies already completed.
+        Steps without declared dependencies keep their place in plan order.
+        """
+        plan = task.plan
+        completed = {s.id for s in plan if s.status is StepStatus.COMPLETED}
+        
+        wave = [start]
+        for i in range(start + 1, len(plan)):
+            step = plan[i]
+            if step.status is StepStatus.COMPLETED:
+                continue
+            if not step.dependencies or not all(dep in completed for dep in step.dependencies):
+                break
+            wave.append(i)
+        return wave
+    
+    async def _record_step_success(self, task: TaskState, step_idx: int, result: Dict):
+        """Apply a completed step's context updates, history and progress update."""
+        step = task.plan[step_idx]
+        now = datetime.utcnow()
+        
+        # Update context with results
+        task.context.update(result["result"].get("context_updates", {}))
+        task.history.append({
+            "step": step_idx,
+            "action": step.action_type,
+            "result": "success",
+            "timestamp": now.isoformat()
+        })
         
-        # All steps completed - validate
-        await self._validate_and_complete(task)
+        # Broadcast progress
+        await self._broadcast_update(task, {
+            "type": "step_complete",
+            "step": step_idx + 1,
+            "total_steps": len(task.plan),
+            "description": step.description
+        }, now=now)
     
-    async def _validate_and_complete(self, task: TaskState):
-        """Validate task completion and notify user."""
+    async def _validate_and_complete(self, task: TaskState) -> bool:
+        """
+        Validate task completion and notify user.
+        
+        Returns:
+            True if steps were added to the plan and execution should continue
+        """
         # State: VALIDATING
         await self._transition_state(task, TaskStatus.VALIDATING)
-        await self._broadcast_update(task, {"type": "status_change", "status": "validating"})
+        await self._broadcast_update(task, {"type": "status_change", "status": "validating"}, now=task.updated_at)
         
-        validation = await self.validator.validate_completion(
-            task.outcome,
-            task.context,
-            task.history
-        )
+        validation = await self._validate(task)
         
-        print(f"\nValidation result:")
-        print(f"  Completed: {validation['completed']}")
-        print(f"  Confidence: {validation['confidence']:.2%}")
+        log.info("Validation result - completed: %s, confidence: %.2f%%",
+                 validation['completed'], validation['confidence'] * 100)
         
         if validation["completed"]:
             # Task complete!
             await self._transition_state(task, TaskStatus.COMPLETED)
             await self._notify_completion(task, validation)
+            return False
         else:
             # Need to do more work
-            # Need to do more work
-            print(f"Validation failed, replanning...")
+            log.info("Validation failed, replanning...")
             
             # Check for infinite loop/max replans
             replan_count = task.context.get("_replan_count", 0)
             if replan_count >= 3:
-                print(f"Max replan attempts ({replan_count}) reached. Forcing completion.")
+                log.warning("Max replan attempts (%d) reached. Forcing completion.", replan_count)
                 # Consider it partial success or just stop
                 await self._transition_state(task, TaskStatus.COMPLETED)
                 validation["note"] = "Forced completion after max retries"
                 await self._notify_completion(task, validation)
-                return
+                return False
 
             if validation.get("needs_more_work"):
                 task.context["_replan_count"] = replan_count + 1
@@ -254,10 +398,40 @@ class AgentOrchestrator:
                 task.status = TaskStatus.EXECUTING  # Direct assignment to avoid transition issues
                 await state_manager.save_state(task)
                 # Continue execution
-                await self._execute_plan(task)
+                return True
             else:
                 await self._transition_state(task, TaskStatus.FAILED)
                 await self._notify_failure(task, "Validation failed and cannot replan")
+                return False
+    
+    async def _validate(self, task: TaskState) -> Dict:
+        """
+        Run the completion validator, reusing the last result when neither the
+        outcome, the context evidence nor the history changed since it ran.
+        Underscored bookkeeping keys such as _replan_count aren't evidence, and
+        history is append-only, so its length tells whether it grew.
+        
+        The evidence is compared in serialized form so nested values changed in
+        place are noticed, and callers get their own copy of the result since
+        they may annotate it.
+        """
+        evidence = orjson.dumps(
+            {k: v for k, v in task.context.items() if not k.startswith("_")},
+            option=orjson.OPT_SORT_KEYS, default=str
+        )
+        cached = task._validation
+        if (cached is not None and cached[0] is task.outcome and cached[1] == evidence
+                and cached[2] == len(task.history)):
+            log.info("Context and history unchanged since last validation, reusing result")
+            return copy.deepcopy(cached[3])
+        
+        validation = await self.validator.validate_completion(
+            task.outcome,
+            task.context,
+            task.history
+        )
+        task._validation = (task.outcome, evidence, len(task.history), copy.deepcopy(validation))
+        return validation
     
     async def _handle_interruption(self, task: TaskState, e: HumanInterruptionRequired):
         """Handle interruption by pausing task and notifying user."""
@@ -270,7 +444,7 @@ class AgentOrchestrator:
         task.interrupt_data = e.data
         await state_manager.save_state(task)
         
-        print(f"\nTask interrupted: {e.reason}")
+        log.info("Task %s interrupted: %s", task.task_id, e.reason)
         await self._broadcast_update(task, {
             "type": "interrupted",
             "reason": e.reason,
@@ -284,7 +458,7 @@ class AgentOrchestrator:
         task.interrupt_data = {"question": question}
         await state_manager.save_state(task)
         
-        print(f"\nClarification needed: {question}")
+        log.info("Clarification needed for task %s: %s", task.task_id, question)
         await self._broadcast_update(task, {
             "type": "interrupted",
             "reason": "clarification_needed",
@@ -293,8 +467,7 @@ class AgentOrchestrator:
     
     async def _transition_state(self, task: TaskState, new_state: TaskStatus):
         """Validate and execute state transition."""
-        allowed = STATE_TRANSITIONS.get(task.status, [])
-        if new_state not in allowed:
+        if (task.status, new_state) not in ALLOWED_TRANSITIONS:
             raise StateTransitionError(
                 f"Invalid transition: {task.status.value} → {new_state.value}"
             )
@@ -303,34 +476,30 @@ class AgentOrchestrator:
         task.status = new_state
         task.updated_at = datetime.utcnow()
         
-        print(f"State transition: {old_state.value} → {new_state.value}")
+        log.info("State transition: %s → %s", old_state.value, new_state.value)
     
     async def _notify_completion(self, task: TaskState, validation: Dict):
         """Notify user of task completion."""
         task.completed_at = datetime.utcnow()
+        # Stored once here so result requests don't recompute it
+        task.execution_time_seconds = (task.completed_at - task.created_at).total_seconds()
         
         # Build result summary
         result_summary = self._build_result_summary(task)
         task.context["final_result"] = result_summary
         task.context["validation_result"] = validation
         
-        print(f"\n{'='*60}")
-        print(f"TASK COMPLETED: {task.task_id}")
-        print(f"{'='*60}")
-        print(f"Result: {result_summary}")
+        log.info("TASK COMPLETED: %s - result: %s", task.task_id, result_summary)
         
         await self._broadcast_update(task, {
             "type": "completed",
             "result": result_summary,
             "validation": validation
-        })
+        }, now=task.completed_at)
     
     async def _notify_failure(self, task: TaskState, error: str):
         """Notify user of task failure."""
-        print(f"\n{'='*60}")
-        print(f"TASK FAILED: {task.task_id}")
-        print(f"Error: {error}")
-        print(f"{'='*60}")
+        log.error("TASK FAILED: %s - error: %s", task.task_id, error)
         
         await self._broadcast_update(task, {
             "type": "failed",
@@ -347,30 +516,13 @@ class AgentOrchestrator:
             "domain": task.outcome.domain if task.outcome else "unknown",
             "completed_at": task.completed_at.isoformat() if task.completed_at else None,
             "total_steps": len(task.plan),
-            "completed_steps": sum(1 for s in task.plan if s.status.value == "completed")
+            "completed_steps": sum(1 for s in task.plan if s.status is StepStatus.COMPLETED)
         }
         
         # Add domain-specific details
-        if task.outcome and task.outcome.domain == "travel":
-            summary.update({
-                "confirmation_number": context.get("confirmation_number"),
-                "flight_details": context.get("confirmation_details"),
-                "amount_paid": context.get("amount_paid"),
-                "calendar_updated": context.get("calendar_updated", False)
-            })
-        
-        elif task.outcome and task.outcome.domain == "healthcare":
-            summary.update({
-                "appointment_id": context.get("appointment_id"),
-                "appointment_details": context.get("appointment_details"),
-                "provider": context.get("appointment_details", {}).get("provider") if context.get("appointment_details") else None
-            })
-        
-        elif task.outcome and task.outcome.domain == "business":
-            summary.update({
-                "approvals_obtained": context.get("approvals_obtained", True),
-                "final_action": context.get("final_action", "completed")
-            })
+        domain_summary = _DOMAIN_SUMMARIES.get(task.outcome.domain) if task.outcome else None
+        if domain_summary:
+            summary.update(domain_summary(context))
         
         return summary
     
@@ -392,8 +544,7 @@ class AgentOrchestrator:
         if task.status != TaskStatus.INTERRUPTED:
             return {"success": False, "error": f"Task not interrupted (status: {task.status.value})"}
         
-        print(f"\nResuming task {task_id} after interruption")
-        print(f"User response: {user_response}")
+        log.info("Resuming task %s after interruption - user response: %s", task_id, user_response)
         
         # Inject user response into context
         task.context["user_response"] = user_response
@@ -454,30 +605,29 @@ class AgentOrchestrator:
         if task.plan:
             task.status = TaskStatus.EXECUTING
             await state_manager.save_state(task)
-            asyncio.create_task(self._resume_execution(task_id))
+            asyncio.create_task(self._resume_execution(task_id, task))
         else:
             # We were likely analyzing/planning, restart process
             task.status = TaskStatus.PENDING # Reset to pending to allow clean start
             await state_manager.save_state(task)
-            asyncio.create_task(self._process_task(task_id))
+            asyncio.create_task(self._process_task(task_id, task))
         
         return {"success": True, "status": "resumed"}
     
-    async def _resume_execution(self, task_id: str):
+    async def _resume_execution(self, task_id: str, task: Optional[TaskState] = None):
         """
         Resume task execution from current step.
         Called after interruption is resolved.
         """
-        task = await state_manager.load_state(task_id)
+        task = task or await state_manager.load_state(task_id)
         if not task:
-            print(f"Task {task_id} not found for resume")
+            log.warning("Task %s not found for resume", task_id)
             return
         
+        self._bind_callbacks(task_id)
         try:
-            print(f"\n{'='*60}")
-            print(f"Resuming task: {task_id}")
-            print(f"From step: {task.current_step_index + 1}/{len(task.plan)}")
-            print(f"{'='*60}\n")
+            log.info("Resuming task %s from step %d/%d",
+                     task_id, task.current_step_index + 1, len(task.plan))
             
             await self._broadcast_update(task, {"type": "status_change", "status": "executing"})
             
@@ -488,13 +638,15 @@ class AgentOrchestrator:
             await self._handle_interruption(task, e)
             
         except Exception as e:
-            print(f"\nResume failed with error: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Resume failed with error: %s", e)
             
             task.status = TaskStatus.FAILED
             await state_manager.save_state(task)
             await self._notify_failure(task, str(e))
+        
+        finally:
+            self._release_callbacks(task_id)
+            await state_manager.save_state(task)
     
     async def get_task_status(self, task_id: str) -> Optional[Dict]:
         """Get current status of a task."""
@@ -510,23 +662,100 @@ class AgentOrchestrator:
     
     def register_progress_callback(self, task_id: str, callback: Callable):
         """Register a callback for task progress updates."""
-        self.progress_callbacks[task_id] = callback
+        entry = (callback, inspect.iscoroutinefunction(callback))
+        callbacks = self.progress_callbacks.setdefault(task_id, [])
+        if entry not in callbacks:
+            callbacks.append(entry)
     
     def unregister_progress_callback(self, task_id: str):
-        """Unregister a callback for task progress updates."""
-        self.progress_callbacks.pop(task_id, None)
+        """Unregister all callbacks for task progress updates."""
+        callbacks = self.progress_callbacks.pop(task_id, None)
+        if callbacks:
+            # A run still holding the list stops notifying them too
+            callbacks.clear()
+        self._stop_senders(task_id)
+    
+    def _bind_callbacks(self, task_id: str):
+        """
+        Bind the task's callback list to the current asyncio task. The list
+        is shared with progress_callbacks, so later registrations still apply.
+        """
+        _task_callbacks.set((task_id, self.progress_callbacks.setdefault(task_id, [])))
+    
+    def _release_callbacks(self, task_id: str):
+        """Drop the task's callback entry again if nobody registered one."""
+        if not self.progress_callbacks.get(task_id):
+            self.progress_callbacks.pop(task_id, None)
+    
+    def set_global_progress_callback(self, callback: Optional[Callable]):
+        """Set the callback that receives progress updates for all tasks."""
+        self._stop_senders(None)
+        self.global_progress_callback = (
+            (callback, inspect.iscoroutinefunction(callback)) if callback else None
+        )
     
-    async def _broadcast_update(self, task: TaskState, update: Dict):
-        """Broadcast update to registered callbacks."""
+    async def _broadcast_update(self, task: TaskState, update: Dict, now: Optional[datetime] = None):
+        """
+        Broadcast update to registered callbacks. Plain callbacks are called
+        directly; async ones are fed through a queue to their own sender task
+        so a slow subscriber never holds up the task.
+        
+        Callers that just took a timestamp for the same event (a state
+        transition, a history entry) pass it as `now` to reuse it.
+        """
+        owner = task.task_id
+        bound = _task_callbacks.get()
+        if bound is not None and bound[0] == owner:
+            callbacks = bound[1]
+        else:
+            # Broadcast from outside the task's own run (e.g. a resume request)
+            callbacks = self.progress_callbacks.get(owner)
+        if not callbacks:
+            if self.global_progress_callback is None:
+                # Nobody is listening - skip the clock read and formatting
+                return
+            owner = None
+            callbacks = (self.global_progress_callback,)
+        
         update["task_id"] = task.task_id
-        update["timestamp"] = datetime.utcnow().isoformat()
+        update["timestamp"] = (now or datetime.utcnow()).isoformat()
         
-        callback = self.progress_callbacks.get(task.task_id)
-        if callback:
+        for callback, is_async in callbacks:
+            if is_async:
+                self._enqueue_update(owner, callback, update)
+                continue
+            try:
+                callback(update)
+            except Exception as e:
+                log.warning("Error calling progress callback: %s", e)
+    
+    def _enqueue_update(self, owner: Optional[str], callback: Callable, update: Dict):
+        """Queue an update for an async callback, starting its sender on first use."""
+        key = (owner, callback)
+        sender = self._callback_senders.get(key)
+        if sender is None:
+            updates: asyncio.Queue = asyncio.Queue(maxsize=CALLBACK_QUEUE_SIZE)
+            sender = (updates, asyncio.create_task(self._send_updates(updates, callback)))
+            self._callback_senders[key] = sender
+        updates = sender[0]
+        if updates.full():
+            # Drop the oldest update; a lagging subscriber only misses stale progress
+            updates.get_nowait()
+        updates.put_nowait(update)
+    
+    async def _send_updates(self, updates: asyncio.Queue, callback: Callable):
+        """Deliver queued updates to one async callback, in order."""
+        while True:
+            update = await updates.get()
             try:
                 await callback(update)
             except Exception as e:
-                print(f"Error calling progress callback: {e}")
+                log.warning("Error calling progress callback: %s", e)
+    
+    def _stop_senders(self, owner: Optional[str]):
+        """Cancel the sender tasks for a task's callbacks (None for the global one)."""
+        for key in [key for key in self._callback_senders if key[0] == owner]:
+            self._callback_senders.pop(key)[1].cancel()
 
 
 # Import StepStatus for use in resume method
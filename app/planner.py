@@ -1,11 +1,296 @@
 """
 Planner Engine - Generates execution plans to achieve outcomes
 """
+import asyncio
 import json
+import operator
 import os
-from typing import List, Dict, Any
+from collections import deque
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from uuid import uuid4
 
-from .models import OutcomeDefinition, ExecutionStep
+from .models import OutcomeDefinition, ExecutionStep, PlanResponse, StepStatus
+from .llm_client import LLM_LONG_TIMEOUT_S, ResponseCache, cache_key, embed, stream_chat_content
+
+
+# Tools offered to the LLM planner per domain (unknown domains get travel's)
+_DOMAIN_TOOLS: Dict[str, List[Dict]] = {
+    "travel": [
+        {"name": "search_inventory", "description": "Search flights/hotels"},
+        {"name": "select_best_option", "description": "Select best option"},
+        {"name": "check_availability", "description": "Check availability"},
+        {"name": "initiate_booking", "description": "Begin booking"},
+        {"name": "fill_details", "description": "Enter details"},
+        {"name": "process_payment", "description": "Process payment"},
+        {"name": "capture_confirmation", "description": "Get confirmation"},
+        {"name": "add_to_calendar", "description": "Add to calendar"},
+        {"name": "send_notification", "description": "Send notification"}
+    ],
+    "healthcare": [
+        {"name": "search_appointments", "description": "Find available slots"},
+        {"name": "select_appointment", "description": "Select slot"},
+        {"name": "verify_insurance", "description": "Check insurance"},
+        {"name": "book_appointment", "description": "Book appointment"},
+        {"name": "set_reminder", "description": "Set reminder"}
+    ],
+    "business": [
+        {"name": "identify_stakeholders", "description": "Find approvers"},
+        {"name": "create_workflow", "description": "Create workflow"},
+        {"name": "send_approval_request", "description": "Request approval"},
+        {"name": "wait_for_approval", "description": "Wait for response"},
+        {"name": "process_final_action", "description": "Process action"}
+    ],
+    "admin": [
+        {"name": "check_requirements", "description": "Check requirements"},
+        {"name": "prepare_documents", "description": "Prepare docs"},
+        {"name": "submit_application", "description": "Submit"},
+        {"name": "capture_confirmation", "description": "Get confirmation"}
+    ],
+    "research": [
+        {"name": "search_information", "description": "Search sources"},
+        {"name": "extract_information", "description": "Extract data"},
+        {"name": "analyze_data", "description": "Analyze"},
+        {"name": "generate_report", "description": "Create report"},
+        {"name": "deliver_results", "description": "Deliver"}
+    ]
+}
+
+
+class _Field:
+    """Step parameter filled in from the plan's fields when a plan is built"""
+    __slots__ = ("name",)
+    
+    def __init__(self, name: str):
+        self.name = name
+
+
+def _instantiate(blueprints: Tuple, fields: Dict[str, Any]) -> List[ExecutionStep]:
+    """
+    Build fresh steps from a domain's blueprints. The blueprints are trusted,
+    so steps skip validation; dependency indexes become the new step ids.
+    """
+    ids = [str(uuid4()) for _ in blueprints]
+    return [
+        ExecutionStep.model_construct(
+            id=ids[i],
+            description=description.format_map(fields),
+            action_type=action_type,
+            parameters={k: fields[v.name] if isinstance(v, _Field) else v for k, v in parameters.items()},
+            dependencies=[ids[d] for d in deps],
+            max_retries=max_retries
+        )
+        for i, (description, action_type, parameters, deps, max_retries) in enumerate(blueprints)
+    ]
+
+
+def _travel_fields(outcome: OutcomeDefinition, context: Dict) -> Dict[str, Any]:
+    return {
+        "destination": context.get("destination", "Tokyo"),
+        "dates": context.get("dates", "next_week"),
+        "budget": outcome.constraints.get("budget", 2000),
+        "passenger_info": context.get("passenger_details", {}),
+        "goal": outcome.original_goal,
+    }
+
+
+def _healthcare_fields(outcome: OutcomeDefinition, context: Dict) -> Dict[str, Any]:
+    service = context.get("service", "annual_physical")
+    return {
+        "service": service,
+        "service_name": service.replace("_", " ").title(),
+        "provider": context.get("provider", "any"),
+        "timeframe": outcome.constraints.get("timeframe", "next_week"),
+        "insurance_info": context.get("insurance", {}),
+    }
+
+
+def _business_fields(outcome: OutcomeDefinition, context: Dict) -> Dict[str, Any]:
+    return {
+        "approval_type": context.get("approval_type", "payment"),
+        "amount": outcome.constraints.get("budget", 0),
+        "goal": outcome.original_goal,
+        "final_action": context.get("final_action", "payment"),
+    }
+
+
+def _admin_fields(outcome: OutcomeDefinition, context: Dict) -> Dict[str, Any]:
+    return {"task_type": context.get("task_type", "renewal")}
+
+
+def _research_fields(outcome: OutcomeDefinition, context: Dict) -> Dict[str, Any]:
+    return {
+        "goal": outcome.original_goal,
+        "num_results": context.get("num_results", 10),
+        "format": context.get("format", "summary"),
+        "delivery_method": context.get("delivery_method", "email"),
+    }
+
+
+def _generic_fields(outcome: OutcomeDefinition, context: Dict) -> Dict[str, Any]:
+    return {"goal": outcome.original_goal}
+
+
+# Template plans per domain: a function computing the plan's fields, and step
+# blueprints of (description format, action_type, parameters, dependency
+# indexes, max_retries). "{{...}}" parameters are resolved at execution time.
+_PLAN_TEMPLATES: Dict[str, Tuple[Callable, Tuple]] = {
+    "travel": (_travel_fields, (
+        ("🔍 Searching 500+ flights across Emirates, Qatar Airways, Singapore Airlines to {destination}",
+         "search_inventory",
+         {"destination": _Field("destination"), "dates": _Field("dates"), "budget": _Field("budget")}, (), 3),
+        ("📊 Analyzing options and selecting best flight based on price, duration, and reviews",
+         "select_best_option", {"criteria": "price_preference"}, (0,), 2),
+        ("✅ Verifying seat availability and current pricing with airline",
+         "check_availability", {}, (1,), 3),
+        ("📝 Starting secure booking session with airline",
+         "initiate_booking", {}, (2,), 2),
+        ("👤 Entering passenger details and preferences",
+         "fill_details", {"passenger_info": _Field("passenger_info")}, (3,), 2),
+        ("💳 Requesting payment approval for booking (up to ${budget})",
+         "request_payment_approval", {"amount": "{{estimated_cost}}", "description": _Field("goal")}, (4,), 1),
+        ("🔒 Processing secure payment through encrypted gateway",
+         "process_payment", {"payment_method": "{{user_payment_method}}"}, (5,), 2),
+        ("🎫 Generating e-ticket and booking confirmation",
+         "capture_confirmation", {}, (6,), 3),
+        ("📅 Adding flight to your calendar with reminders",
+         "add_to_calendar", {"booking_details": "{{booking_details}}"}, (7,), 2),
+        ("📧 Sending confirmation email with e-ticket and itinerary",
+         "send_notification", {"type": "confirmation", "booking_details": "{{booking_details}}"}, (7,), 3),
+    )),
+    "healthcare": (_healthcare_fields, (
+        ("🏥 Searching nearby clinics for {service_name} appointments",
+         "search_appointments",
+         {"provider": _Field("provider"), "service": _Field("service"), "timeframe": _Field("timeframe")}, (), 3),
+        ("👨‍⚕️ Selecting best available doctor based on ratings and availability",
+         "select_appointment", {}, (0,), 2),
+        ("🔍 Verifying insurance coverage and estimating copay",
+         "verify_insurance", {"insurance_info": _Field("insurance_info")}, (1,), 2),
+        ("✅ Confirming appointment with clinic",
+         "book_appointment", {}, (2,), 3),
+        ("📅 Adding appointment to your calendar",
+         "add_to_calendar", {"appointment_details": "{{appointment_details}}"}, (3,), 2),
+        ("⏰ Setting reminder for 24 hours before appointment",
+         "set_reminder", {"appointment_time": "{{appointment_time}}"}, (3,), 2),
+        ("📧 Sending confirmation with preparation instructions",
+         "send_notification", {"type": "appointment_confirmation"}, (3,), 3),
+    )),
+    "business": (_business_fields, (
+        ("Identify required approvers",
+         "identify_stakeholders", {"approval_type": _Field("approval_type"), "amount": _Field("amount")}, (), 2),
+        ("Create sequential approval workflow",
+         "create_workflow", {}, (0,), 2),
+        ("Send approval request to first stakeholder",
+         "send_approval_request", {"approver": "{{first_approver}}", "details": _Field("goal")}, (1,), 3),
+        ("Wait for first approval (48h timeout)",
+         "wait_for_approval", {"approver": "{{first_approver}}", "timeout": 48}, (2,), 1),
+        ("Send approval request to second stakeholder",
+         "send_approval_request", {"approver": "{{second_approver}}", "details": _Field("goal")}, (3,), 3),
+        ("Wait for second approval (48h timeout)",
+         "wait_for_approval", {"approver": "{{second_approver}}", "timeout": 48}, (4,), 1),
+        ("Process payment or sign contract",
+         "process_final_action", {"action_type": _Field("final_action")}, (5,), 2),
+        ("Send completion notification to all stakeholders",
+         "send_notification", {"type": "approval_complete", "recipients": "{{all_stakeholders}}"}, (6,), 3),
+    )),
+    "admin": (_admin_fields, (
+        ("Check requirements and gather needed information",
+         "check_requirements", {"task_type": _Field("task_type")}, (), 2),
+        ("Prepare application/documents",
+         "prepare_documents", {}, (0,), 2),
+        ("Submit application",
+         "submit_application", {}, (1,), 3),
+        ("Process payment if required",
+         "process_payment", {"amount": "{{fee_amount}}"}, (2,), 2),
+        ("Capture confirmation/receipt",
+         "capture_confirmation", {}, (3,), 3),
+        ("Send confirmation to user",
+         "send_notification", {"type": "completion_confirmation"}, (4,), 3),
+    )),
+    "research": (_research_fields, (
+        ("Search for relevant information/sources",
+         "search_information", {"query": _Field("goal"), "num_results": _Field("num_results")}, (), 3),
+        ("Gather and extract key information",
+         "extract_information", {}, (0,), 2),
+        ("Analyze and synthesize findings",
+         "analyze_data", {}, (1,), 2),
+        ("Generate summary/report",
+         "generate_report", {"format": _Field("format")}, (2,), 2),
+        ("Deliver results to user",
+         "deliver_results", {"delivery_method": _Field("delivery_method")}, (3,), 3),
+    )),
+    "other": (_generic_fields, (
+        ("Analyze task requirements",
+         "analyze_task", {"goal": _Field("goal")}, (), 2),
+        ("Execute primary action",
+         "execute_action", {}, (0,), 3),
+        ("Verify results",
+         "verify_results", {}, (1,), 2),
+        ("Notify user of completion",
+         "send_notification", {"type": "task_complete"}, (2,), 3),
+    )),
+}
+
+
+def _prompt_json(value: Any) -> str:
+    """JSON for prompts, without the indentation and spaces that only add input tokens"""
+    return json.dumps(value, separators=(",", ":"))
+
+
+# Bounded because LLM interpretations can name arbitrary domains
+@lru_cache(maxsize=32)
+def _planner_system_prompt(domain: str) -> str:
+    """Planning system prompt for a domain, built once rather than per call"""
+    available_tools = _DOMAIN_TOOLS.get(domain, _DOMAIN_TOOLS["travel"])
+    
+    return f"""You are a Planning Engine for an autonomous agent.
+
+Available tools for {domain} domain:
+{_prompt_json(available_tools)}
+
+Create an execution plan where each step:
+1. Uses exactly one tool/action
+2. Has clear input parameters
+3. Specifies dependencies (previous steps required)
+
+Output compact JSON using these short keys:
+s = steps, d = description, a = tool name, p = parameters,
+x = indexes of earlier steps this step depends on, r = max retries
+{{"s":[{{"d":"what this step does","a":"tool_name","p":{{"key":"value"}},"x":[0],"r":3}}]}}"""
+
+
+# Goals at least this similar (cosine of their embeddings) to an earlier goal
+# in the same domain get that goal's LLM plan adapted instead of a new plan
+PLAN_SIMILARITY_THRESHOLD = float(os.getenv("PLAN_SIMILARITY_THRESHOLD", "0.9"))
+
+
+_ADAPT_SYSTEM_PROMPT = """You adapt an execution plan to a new goal similar to the one it was made for.
+
+You get the new goal, its context and the description (d) and parameters (p) of each
+step of the existing plan. Rewrite both for the new goal, changing only the values that
+differ (destinations, dates, amounts, names). Keep every step, in the same order.
+
+Output JSON: {"s": [{"d": "description of step 1", "p": {parameters of step 1}}, ...]}"""
+
+
+class _SimilarPlanIndex:
+    """Recent LLM plans per domain, with the embedding of the goal each was made for"""
+    
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: Dict[str, deque] = {}
+    
+    def nearest(self, domain: str, vector: List[float]) -> Optional[str]:
+        """The plan whose goal is most similar, if any reaches the threshold"""
+        best, best_score = None, PLAN_SIMILARITY_THRESHOLD
+        for other, content in self._entries.get(domain, ()):
+            score = sum(map(operator.mul, vector, other))
+            if score >= best_score:
+                best, best_score = content, score
+        return best
+    
+    def add(self, domain: str, vector: List[float], content: str):
+        self._entries.setdefault(domain, deque(maxlen=self.maxsize)).append((vector, content))
 
 
 class PlannerEngine:
@@ -17,6 +302,13 @@ class PlannerEngine:
     def __init__(self):
         self.use_llm = os.getenv("USE_LLM", "false").lower() == "true"
         self.api_key = os.getenv("OPENAI_API_KEY", "")
+        # Raw LLM plan responses by (domain, criteria, context); steps are
+        # rebuilt from the text on every hit so tasks never share step objects
+        self._cache = ResponseCache(int(os.getenv("PLANNER_CACHE_SIZE", "1024")))
+        # Plans for earlier goals, reused for near-duplicate goals
+        self._similar = _SimilarPlanIndex(int(os.getenv("PLAN_INDEX_SIZE", "256")))
+        # Cache key -> plan generation in progress, shared by identical concurrent requests
+        self._inflight: Dict[str, asyncio.Future] = {}
     
     async def create_plan(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
         """
@@ -33,557 +325,121 @@ class PlannerEngine:
     
     async def _create_plan_with_llm(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
         """Use LLM to generate plan"""
-        import openai
-        client = openai.AsyncOpenAI(api_key=self.api_key)
-        
-        available_tools = self._get_tools_for_domain(outcome.domain)
-        
-        system_prompt = f"""You are a Planning Engine for an autonomous agent.
-
-Available tools for {outcome.domain} domain:
-{json.dumps(available_tools, indent=2)}
-
-Create an execution plan where each step:
-1. Uses exactly one tool/action
-2. Has clear input parameters
-3. Specifies dependencies (previous steps required)
-4. Includes retry strategy
-5. Has failure fallback
-
-Output JSON format:
-{{
-    "steps": [
-        {{
-            "description": "what this step does",
-            "action_type": "tool_name",
-            "parameters": {{"key": "value"}},
-            "dependencies": [],
-            "max_retries": 3,
-            "failure_strategy": "retry|skip|alternative|human"
-        }}
-    ]
-}}"""
-
-        response = await client.chat.completions.create(
+        key = cache_key(outcome.domain, outcome.success_criteria, context)
+        content = self._cache.get(key)
+        if content is None:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = asyncio.ensure_future(self._generate_plan(outcome, context))
+                self._inflight[key] = inflight
+                inflight.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # Shielded so one cancelled caller doesn't cancel the shared call
+            content = await asyncio.shield(inflight)
+            self._cache.put(key, content)
+        # One pass parses and validates the short-key response; the steps are
+        # then built unvalidated, with dependency indexes mapped to step ids
+        planned = PlanResponse.model_validate_json(content).steps
+        ids = [str(uuid4()) for _ in planned]
+        return [
+            ExecutionStep.model_construct(
+                id=ids[i],
+                description=step.description,
+                action_type=step.action_type,
+                parameters=step.parameters,
+                dependencies=[ids[d] for d in step.dependencies if 0 <= d < i],
+                max_retries=step.max_retries
+            )
+            for i, step in enumerate(planned)
+        ]
+    
+    async def _generate_plan(self, outcome: OutcomeDefinition, context: Dict) -> str:
+        """Plan text for a cache miss; only parseable plans are returned"""
+        content = await self._plan_from_similar_goal(outcome, context)
+        if content is None:
+            content = await self._plan_from_scratch(outcome, context)
+        return content
+    
+    async def _plan_from_scratch(self, outcome: OutcomeDefinition, context: Dict) -> str:
+        """Ask the LLM for a full plan, and index it for similar goals later"""
+        system_prompt = _planner_system_prompt(outcome.domain)
+        
+        # Streamed so the plan is decoded as it arrives rather than in
+        # one response body at the end
+        content = await stream_chat_content(
+            self.api_key,
+            # A full plan takes far longer to generate than a short answer
+            timeout=LLM_LONG_TIMEOUT_S,
             model="gpt-4-turbo-preview",
             messages=[
                 {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Success criteria: {json.dumps(outcome.success_criteria)}\nContext: {json.dumps(context)}"}
+                {"role": "user", "content": f"Success criteria: {_prompt_json(outcome.success_criteria)}\nContext: {_prompt_json(context)}"}
             ],
             response_format={"type": "json_object"},
             temperature=0.2
         )
         
-        plan_data = json.loads(response.choices[0].message.content)
-        
-        steps = []
-        for step_data in plan_data.get("steps", []):
-            steps.append(ExecutionStep(
-                description=step_data["description"],
-                action_type=step_data["action_type"],
-                parameters=step_data.get("parameters", {}),
-                dependencies=step_data.get("dependencies", []),
-                max_retries=step_data.get("max_retries", 3)
-            ))
-        
-        return steps
-    
-    async def _create_plan_template(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
-        """Create plan using domain-specific templates"""
-        
-        domain_planners = {
-            "travel": self._plan_travel,
-            "healthcare": self._plan_healthcare,
-            "business": self._plan_business,
-            "admin": self._plan_admin,
-            "research": self._plan_research,
-            "other": self._plan_generic
-        }
-        
-        planner = domain_planners.get(outcome.domain, self._plan_generic)
-        return await planner(outcome, context)
-    
-    async def _plan_travel(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
-        """Generate travel booking plan with detailed step descriptions"""
-        steps = []
-        destination = context.get("destination", "Tokyo")
-        budget = outcome.constraints.get("budget", 2000)
-        
-        # Step 1: Search with detailed description
-        steps.append(ExecutionStep(
-            description=f"🔍 Searching 500+ flights across Emirates, Qatar Airways, Singapore Airlines to {destination}",
-            action_type="search_inventory",
-            parameters={
-                "destination": destination,
-                "dates": context.get("dates", "next_week"),
-                "budget": budget
-            },
-            max_retries=3
-        ))
-        
-        # Step 2: Select best option
-        steps.append(ExecutionStep(
-            description=f"📊 Analyzing options and selecting best flight based on price, duration, and reviews",
-            action_type="select_best_option",
-            parameters={
-                "criteria": "price_preference"
-            },
-            dependencies=[steps[0].id],
-            max_retries=2
-        ))
-        
-        # Step 3: Check availability
-        steps.append(ExecutionStep(
-            description="✅ Verifying seat availability and current pricing with airline",
-            action_type="check_availability",
-            parameters={},
-            dependencies=[steps[1].id],
-            max_retries=3
-        ))
-        
-        # Step 4: Initiate booking
-        steps.append(ExecutionStep(
-            description="📝 Starting secure booking session with airline",
-            action_type="initiate_booking",
-            parameters={},
-            dependencies=[steps[2].id],
-            max_retries=2
-        ))
-        
-        # Step 5: Fill details
-        steps.append(ExecutionStep(
-            description="👤 Entering passenger details and preferences",
-            action_type="fill_details",
-            parameters={
-                "passenger_info": context.get("passenger_details", {})
-            },
-            dependencies=[steps[3].id],
-            max_retries=2
-        ))
-        
-        # Step 6: Request payment approval
-        steps.append(ExecutionStep(
-            description=f"💳 Requesting payment approval for booking (up to ${budget})",
-            action_type="request_payment_approval",
-            parameters={
-                "amount": "{{estimated_cost}}",
-                "description": outcome.original_goal
-            },
-            dependencies=[steps[4].id],
-            max_retries=1
-        ))
-        
-        # Step 7: Process payment
-        steps.append(ExecutionStep(
-            description="🔒 Processing secure payment through encrypted gateway",
-            action_type="process_payment",
-            parameters={
-                "payment_method": "{{user_payment_method}}"
-            },
-            dependencies=[steps[5].id],
-            max_retries=2
-        ))
-        
-        # Step 8: Capture confirmation
-        steps.append(ExecutionStep(
-            description="🎫 Generating e-ticket and booking confirmation",
-            action_type="capture_confirmation",
-            parameters={},
-            dependencies=[steps[6].id],
-            max_retries=3
-        ))
-        
-        # Step 9: Add to calendar
-        steps.append(ExecutionStep(
-            description="📅 Adding flight to your calendar with reminders",
-            action_type="add_to_calendar",
-            parameters={
-                "booking_details": "{{booking_details}}"
-            },
-            dependencies=[steps[7].id],
-            max_retries=2
-        ))
-        
-        # Step 10: Send confirmation
-        steps.append(ExecutionStep(
-            description="📧 Sending confirmation email with e-ticket and itinerary",
-            action_type="send_notification",
-            parameters={
-                "type": "confirmation",
-                "booking_details": "{{booking_details}}"
-            },
-            dependencies=[steps[7].id],
-            max_retries=3
-        ))
-        
-        return steps
-    
-    async def _plan_healthcare(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
-        """Generate healthcare appointment plan with detailed descriptions"""
-        steps = []
-        service = context.get("service", "annual_physical").replace("_", " ").title()
-        
-        steps.append(ExecutionStep(
-            description=f"🏥 Searching nearby clinics for {service} appointments",
-            action_type="search_appointments",
-            parameters={
-                "provider": context.get("provider", "any"),
-                "service": context.get("service", "annual_physical"),
-                "timeframe": outcome.constraints.get("timeframe", "next_week")
-            },
-            max_retries=3
-        ))
-        
-        steps.append(ExecutionStep(
-            description="👨‍⚕️ Selecting best available doctor based on ratings and availability",
-            action_type="select_appointment",
-            parameters={},
-            dependencies=[steps[0].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="🔍 Verifying insurance coverage and estimating copay",
-            action_type="verify_insurance",
-            parameters={
-                "insurance_info": context.get("insurance", {})
-            },
-            dependencies=[steps[1].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="✅ Confirming appointment with clinic",
-            action_type="book_appointment",
-            parameters={},
-            dependencies=[steps[2].id],
-            max_retries=3
-        ))
-        
-        steps.append(ExecutionStep(
-            description="📅 Adding appointment to your calendar",
-            action_type="add_to_calendar",
-            parameters={
-                "appointment_details": "{{appointment_details}}"
-            },
-            dependencies=[steps[3].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="⏰ Setting reminder for 24 hours before appointment",
-            action_type="set_reminder",
-            parameters={
-                "appointment_time": "{{appointment_time}}"
-            },
-            dependencies=[steps[3].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="📧 Sending confirmation with preparation instructions",
-            action_type="send_notification",
-            parameters={
-                "type": "appointment_confirmation"
-            },
-            dependencies=[steps[3].id],
-            max_retries=3
-        ))
-        
-        return steps
-    
-    async def _plan_business(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
-        """Generate business approval workflow plan"""
-        steps = []
-        
-        # Step 1: Identify stakeholders
-        steps.append(ExecutionStep(
-            description="Identify required approvers",
-            action_type="identify_stakeholders",
-            parameters={
-                "approval_type": context.get("approval_type", "payment"),
-                "amount": outcome.constraints.get("budget", 0)
-            },
-            max_retries=2
-        ))
-        
-        # Step 2: Create approval workflow
-        steps.append(ExecutionStep(
-            description="Create sequential approval workflow",
-            action_type="create_workflow",
-            parameters={},
-            dependencies=[steps[0].id],
-            max_retries=2
-        ))
-        
-        # Step 3: Send to first approver
-        steps.append(ExecutionStep(
-            description="Send approval request to first stakeholder",
-            action_type="send_approval_request",
-            parameters={
-                "approver": "{{first_approver}}",
-                "details": outcome.original_goal
-            },
-            dependencies=[steps[1].id],
-            max_retries=3
-        ))
-        
-        # Step 4: Wait for first approval
-        steps.append(ExecutionStep(
-            description="Wait for first approval (48h timeout)",
-            action_type="wait_for_approval",
-            parameters={
-                "approver": "{{first_approver}}",
-                "timeout": 48
-            },
-            dependencies=[steps[2].id],
-            max_retries=1
-        ))
-        
-        # Step 5: Send to second approver (if needed)
-        steps.append(ExecutionStep(
-            description="Send approval request to second stakeholder",
-            action_type="send_approval_request",
-            parameters={
-                "approver": "{{second_approver}}",
-                "details": outcome.original_goal
-            },
-            dependencies=[steps[3].id],
-            max_retries=3
-        ))
-        
-        # Step 6: Wait for second approval
-        steps.append(ExecutionStep(
-            description="Wait for second approval (48h timeout)",
-            action_type="wait_for_approval",
-            parameters={
-                "approver": "{{second_approver}}",
-                "timeout": 48
-            },
-            dependencies=[steps[4].id],
-            max_retries=1
-        ))
-        
-        # Step 7: Process final action
-        steps.append(ExecutionStep(
-            description="Process payment or sign contract",
-            action_type="process_final_action",
-            parameters={
-                "action_type": context.get("final_action", "payment")
-            },
-            dependencies=[steps[5].id],
-            max_retries=2
-        ))
-        
-        # Step 8: Notify all parties
-        steps.append(ExecutionStep(
-            description="Send completion notification to all stakeholders",
-            action_type="send_notification",
-            parameters={
-                "type": "approval_complete",
-                "recipients": "{{all_stakeholders}}"
-            },
-            dependencies=[steps[6].id],
-            max_retries=3
-        ))
-        
-        return steps
+        PlanResponse.model_validate_json(content)  # Invalid plans aren't indexed
+        vector = await self._goal_embedding(outcome.original_goal)
+        if vector is not None:
+            self._similar.add(outcome.domain, vector, content)
+        return content
     
-    async def _plan_admin(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
-        """Generate admin task plan"""
-        steps = []
-        
-        steps.append(ExecutionStep(
-            description="Check requirements and gather needed information",
-            action_type="check_requirements",
-            parameters={
-                "task_type": context.get("task_type", "renewal")
-            },
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Prepare application/documents",
-            action_type="prepare_documents",
-            parameters={},
-            dependencies=[steps[0].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Submit application",
-            action_type="submit_application",
-            parameters={},
-            dependencies=[steps[1].id],
-            max_retries=3
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Process payment if required",
-            action_type="process_payment",
-            parameters={
-                "amount": "{{fee_amount}}"
-            },
-            dependencies=[steps[2].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Capture confirmation/receipt",
-            action_type="capture_confirmation",
-            parameters={},
-            dependencies=[steps[3].id],
-            max_retries=3
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Send confirmation to user",
-            action_type="send_notification",
-            parameters={
-                "type": "completion_confirmation"
-            },
-            dependencies=[steps[4].id],
-            max_retries=3
-        ))
+    async def _plan_from_similar_goal(self, outcome: OutcomeDefinition, context: Dict) -> Optional[str]:
+        """
+        Adapt the plan of a near-duplicate earlier goal. A small model only
+        rewrites the step descriptions and parameters; tools, dependencies and
+        retries are kept, so the response is a fraction of a plan.
         
-        return steps
+        Returns:
+            The adapted plan, or None to plan from scratch
+        """
+        vector = await self._goal_embedding(outcome.original_goal)
+        similar = self._similar.nearest(outcome.domain, vector) if vector is not None else None
+        if similar is None:
+            return None
+        
+        try:
+            steps = json.loads(similar).get("s", [])
+            content = await stream_chat_content(
+                self.api_key,
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": _ADAPT_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Goal: {outcome.original_goal}\nContext: {_prompt_json(context)}\n"
+                                                f"Steps: {_prompt_json({'s': [{'d': step['d'], 'p': step.get('p', {})} for step in steps]})}"}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0
+            )
+            adapted = json.loads(content)["s"]
+            if len(adapted) != len(steps):
+                raise ValueError(f"expected {len(steps)} steps, got {len(adapted)}")
+            # Descriptions are shown to the user, so an adapted step must have one
+            new_steps = [dict(step, d=str(new["d"]), p=new.get("p", {})) for step, new in zip(steps, adapted)]
+            content = json.dumps({"s": new_steps})
+            PlanResponse.model_validate_json(content)  # Invalid plans aren't cached
+        except Exception as e:
+            print(f"Plan adaptation failed: {e}, planning from scratch")
+            return None
+        
+        return content
     
-    async def _plan_research(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
-        """Generate research task plan"""
-        steps = []
-        
-        steps.append(ExecutionStep(
-            description="Search for relevant information/sources",
-            action_type="search_information",
-            parameters={
-                "query": outcome.original_goal,
-                "num_results": context.get("num_results", 10)
-            },
-            max_retries=3
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Gather and extract key information",
-            action_type="extract_information",
-            parameters={},
-            dependencies=[steps[0].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Analyze and synthesize findings",
-            action_type="analyze_data",
-            parameters={},
-            dependencies=[steps[1].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Generate summary/report",
-            action_type="generate_report",
-            parameters={
-                "format": context.get("format", "summary")
-            },
-            dependencies=[steps[2].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Deliver results to user",
-            action_type="deliver_results",
-            parameters={
-                "delivery_method": context.get("delivery_method", "email")
-            },
-            dependencies=[steps[3].id],
-            max_retries=3
-        ))
-        
-        return steps
+    async def _goal_embedding(self, goal: str) -> Optional[List[float]]:
+        """Embedding of a goal, or None when embeddings are unavailable"""
+        try:
+            return await embed(self.api_key, goal)
+        except Exception as e:
+            print(f"Goal embedding failed: {e}")
+            return None
     
-    async def _plan_generic(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
-        """Generate generic task plan"""
-        steps = []
-        
-        steps.append(ExecutionStep(
-            description="Analyze task requirements",
-            action_type="analyze_task",
-            parameters={
-                "goal": outcome.original_goal
-            },
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Execute primary action",
-            action_type="execute_action",
-            parameters={},
-            dependencies=[steps[0].id],
-            max_retries=3
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Verify results",
-            action_type="verify_results",
-            parameters={},
-            dependencies=[steps[1].id],
-            max_retries=2
-        ))
-        
-        steps.append(ExecutionStep(
-            description="Notify user of completion",
-            action_type="send_notification",
-            parameters={
-                "type": "task_complete"
-            },
-            dependencies=[steps[2].id],
-            max_retries=3
-        ))
-        
-        return steps
+    async def _create_plan_template(self, outcome: OutcomeDefinition, context: Dict) -> List[ExecutionStep]:
+        """Create plan using domain-specific templates"""
+        plan_fields, blueprints = _PLAN_TEMPLATES.get(outcome.domain, _PLAN_TEMPLATES["other"])
+        return _instantiate(blueprints, plan_fields(outcome, context))
     
     def _get_tools_for_domain(self, domain: str) -> List[Dict]:
         """Get available tools for a domain"""
-        tools = {
-            "travel": [
-                {"name": "search_inventory", "description": "Search flights/hotels"},
-                {"name": "select_best_option", "description": "Select best option"},
-                {"name": "check_availability", "description": "Check availability"},
-                {"name": "initiate_booking", "description": "Begin booking"},
-                {"name": "fill_details", "description": "Enter details"},
-                {"name": "process_payment", "description": "Process payment"},
-                {"name": "capture_confirmation", "description": "Get confirmation"},
-                {"name": "add_to_calendar", "description": "Add to calendar"},
-                {"name": "send_notification", "description": "Send notification"}
-            ],
-            "healthcare": [
-                {"name": "search_appointments", "description": "Find available slots"},
-                {"name": "select_appointment", "description": "Select slot"},
-                {"name": "verify_insurance", "description": "Check insurance"},
-                {"name": "book_appointment", "description": "Book appointment"},
-                {"name": "set_reminder", "description": "Set reminder"}
-            ],
-            "business": [
-                {"name": "identify_stakeholders", "description": "Find approvers"},
-                {"name": "create_workflow", "description": "Create workflow"},
-                {"name": "send_approval_request", "description": "Request approval"},
-                {"name": "wait_for_approval", "description": "Wait for response"},
-                {"name": "process_final_action", "description": "Process action"}
-            ],
-            "admin": [
-                {"name": "check_requirements", "description": "Check requirements"},
-                {"name": "prepare_documents", "description": "Prepare docs"},
-                {"name": "submit_application", "description": "Submit"},
-                {"name": "capture_confirmation", "description": "Get confirmation"}
-            ],
-            "research": [
-                {"name": "search_information", "description": "Search sources"},
-                {"name": "extract_information", "description": "Extract data"},
-                {"name": "analyze_data", "description": "Analyze"},
-                {"name": "generate_report", "description": "Create report"},
-                {"name": "deliver_results", "description": "Deliver"}
-            ]
-        }
-        return tools.get(domain, tools.get("travel", []))
+        return _DOMAIN_TOOLS.get(domain, _DOMAIN_TOOLS["travel"])
     
     async def replan(self, task_state, failure_point: int, error: str) -> List[ExecutionStep]:
         """Adapt plan when something fails - try alternative approach or ask user"""
@@ -592,8 +448,12 @@ Output JSON format:
         
         print(f"Replanning due to failure in step: {failed_step.description}")
         
-        # fallback to asking user for help
-        alternative_step = ExecutionStep(
+        # The help step follows the most recent completed step, if any
+        last_completed = next((s.id for s in reversed(completed_steps) if s.status is StepStatus.COMPLETED), None)
+        
+        # fallback to asking user for help (built from trusted values, so unvalidated)
+        alternative_step = ExecutionStep.model_construct(
+            id=str(uuid4()),
             description=f"Ask user for valid inputs to proceed. Error: {error}",
             action_type="request_user_help",
             parameters={
@@ -601,7 +461,7 @@ Output JSON format:
                 "step_description": failed_step.description,
                 "original_params": failed_step.parameters
             },
-            dependencies=[s.id for s in completed_steps if s.status.value == "completed"][-1:] if completed_steps else [],
+            dependencies=[last_completed] if last_completed else [],
             max_retries=2
         )
         
@@ -614,14 +474,14 @@ Output JSON format:
         old_failed_id = failed_step.id
         new_help_id = alternative_step.id
         
-        for step in task_state.plan[failure_point + 1:]:
-            # Create a copy to avoid mutating original if we were using it (though here we are building new list)
-            new_step = step.copy() # ExecutionStep is pydantic, has .copy()
-            
-            # Update dependencies
-            if old_failed_id in new_step.dependencies:
-                new_step.dependencies = [new_help_id if d == old_failed_id else d for d in new_step.dependencies]
-            
-            new_plan.append(new_step)
+        # The new plan replaces the old one, so steps that didn't depend on the
+        # failed step are carried over as they are; the others get a copy
+        new_plan.extend(
+            step.model_copy(update={
+                "dependencies": [new_help_id if d == old_failed_id else d for d in step.dependencies]
+            })
+            if old_failed_id in step.dependencies else step
+            for step in task_state.plan[failure_point + 1:]
+        )
         
         return new_plan
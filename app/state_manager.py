@@ -2,15 +2,21 @@
 State Management - Handles persistence of task state
 Uses Redis for short-term state and JSON files for demo (PostgreSQL in production)
 """
-import json
 import os
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 from pathlib import Path
 
+import orjson
+
 from .models import TaskState, TaskStatus
 
 
+# Step progress is written to disk at most once per this many steps;
+# state transitions, interruptions and task exit always write immediately
+SAVE_EVERY_STEPS = int(os.getenv("STATE_SAVE_EVERY_STEPS", "5"))
+
+
 class StateManager:
     """Manages task state persistence"""
     
@@ -18,6 +24,10 @@ class StateManager:
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
         self._memory_cache: Dict[str, TaskState] = {}
+        # Task ID -> changes recorded by mark_dirty since the last write
+        self._unsaved_changes: Dict[str, int] = {}
+        # Task ID -> history entries already in its journal file
+        self._history_written: Dict[str, int] = {}
     
     async def save_state(self, task: TaskState) -> None:
         """Save task state to storage"""
@@ -25,11 +35,44 @@ class StateManager:
         
         # Save to memory cache
         self._memory_cache[task.task_id] = task
+        self._unsaved_changes.pop(task.task_id, None)
         
-        # Save to file for persistence
+        # Save to file for persistence. History only ever grows, so it goes
+        # to a separate journal and each save appends just the new entries
+        data = task.to_dict()
+        self._append_history(task.task_id, data.pop("history"))
         file_path = self.storage_path / f"{task.task_id}.json"
-        with open(file_path, 'w') as f:
-            json.dump(task.to_dict(), f, indent=2, default=str)
+        with open(file_path, 'wb') as f:
+            f.write(orjson.dumps(data, default=str))
+    
+    def _append_history(self, task_id: str, history: list) -> None:
+        """Write history entries not yet in the task's journal, one JSON line each"""
+        written = self._history_written.get(task_id, 0)
+        if written == len(history) and written:
+            return
+        if written > len(history) or not written:
+            # First save in this process, or the history was replaced - rewrite it
+            written, mode = 0, 'wb'
+        else:
+            mode = 'ab'
+        
+        with open(self.storage_path / f"{task_id}.history.jsonl", mode) as f:
+            f.write(b"".join(orjson.dumps(entry, default=str) + b"\n" for entry in history[written:]))
+        self._history_written[task_id] = len(history)
+    
+    async def mark_dirty(self, task: TaskState) -> None:
+        """
+        Record a change to a task. Readers see it straight away through the
+        memory cache; the file is only rewritten every SAVE_EVERY_STEPS changes.
+        """
+        task.updated_at = datetime.utcnow()
+        self._memory_cache[task.task_id] = task
+        
+        changes = self._unsaved_changes.get(task.task_id, 0) + 1
+        if changes >= SAVE_EVERY_STEPS:
+            await self.save_state(task)
+        else:
+            self._unsaved_changes[task.task_id] = changes
     
     async def load_state(self, task_id: str) -> Optional[TaskState]:
         """Load task state from storage"""
@@ -42,8 +85,15 @@ class StateManager:
         if not file_path.exists():
             return None
         
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        with open(file_path, 'rb') as f:
+            data = orjson.loads(f.read())
+        
+        # Files written before the journal existed still hold their history
+        history_path = self.storage_path / f"{task_id}.history.jsonl"
+        if history_path.exists():
+            with open(history_path, 'rb') as f:
+                data['history'] = [orjson.loads(line) for line in f if line.strip()]
+            self._history_written[task_id] = len(data['history'])
         
         # Reconstruct TaskState
         task = self._dict_to_task_state(data)
@@ -93,6 +143,7 @@ class StateManager:
             created_at=created_at,
             updated_at=updated_at,
             completed_at=completed_at,
+            execution_time_seconds=data.get('execution_time_seconds'),
             interrupt_reason=data.get('interrupt_reason'),
             interrupt_data=data.get('interrupt_data')
         )
@@ -101,10 +152,13 @@ class StateManager:
         """Delete task state"""
         if task_id in self._memory_cache:
             del self._memory_cache[task_id]
+        self._unsaved_changes.pop(task_id, None)
+        self._history_written.pop(task_id, None)
         
-        file_path = self.storage_path / f"{task_id}.json"
-        if file_path.exists():
-            file_path.unlink()
+        for file_path in (self.storage_path / f"{task_id}.json",
+                          self.storage_path / f"{task_id}.history.jsonl"):
+            if file_path.exists():
+                file_path.unlink()
 
 
 # Global state manager instance
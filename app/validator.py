@@ -6,6 +6,26 @@ import os
 from typing import Dict, List, Any
 
 from .models import OutcomeDefinition, VerificationResult
+from .llm_client import LLM_LONG_TIMEOUT_S, chat_completion
+
+
+_SYSTEM_PROMPT = """You are a Completion Validator for an autonomous agent.
+
+Your job: Determine if a success criterion has been met based on execution context.
+
+Rules:
+1. Be strict - "probably" or "likely" is NOT sufficient
+2. Require concrete evidence in context
+3. Confidence must reflect certainty
+4. If evidence is missing, criterion fails
+
+Output JSON:
+{
+    "passed": true/false,
+    "confidence": 0.0-1.0,
+    "evidence": "what proves this criterion is met",
+    "missing": "what evidence is missing (if any)"
+}"""
 
 
 class CompletionValidator:
@@ -47,35 +67,19 @@ class CompletionValidator:
         history: List[Dict]
     ) -> Dict:
         """Use LLM to validate completion"""
-        import openai
-        client = openai.AsyncOpenAI(api_key=self.api_key)
-        
         validation_results = []
         
+        # The evidence is the same for every criterion, so serialize it once
+        evidence = f"Context: {json.dumps(context, indent=2)}\n\nExecution History: {json.dumps(history, indent=2)}"
+        
         for criterion in outcome.success_criteria:
-            system_prompt = """You are a Completion Validator for an autonomous agent.
-
-Your job: Determine if a success criterion has been met based on execution context.
-
-Rules:
-1. Be strict - "probably" or "likely" is NOT sufficient
-2. Require concrete evidence in context
-3. Confidence must reflect certainty
-4. If evidence is missing, criterion fails
-
-Output JSON:
-{
-    "passed": true/false,
-    "confidence": 0.0-1.0,
-    "evidence": "what proves this criterion is met",
-    "missing": "what evidence is missing (if any)"
-}"""
-
-            response = await client.chat.completions.create(
+            response = await chat_completion(
+                self.api_key,
+                timeout=LLM_LONG_TIMEOUT_S,
                 model="gpt-4-turbo-preview",
                 messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Criterion: {criterion}\n\nContext: {json.dumps(context, indent=2)}\n\nExecution History: {json.dumps(history, indent=2)}"}
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Criterion: {criterion}\n\n{evidence}"}
                 ],
                 response_format={"type": "json_object"},
                 temperature=0.1
@@ -31,9 +31,13 @@ export function useWebSocket(
 
     ws.onmessage = (event) => {
       try {
-        const message: WebSocketMessage = JSON.parse(event.data);
-        console.log('WebSocket message:', message);
-        onMessage?.(message);
+        const data = JSON.parse(event.data);
+        // The server coalesces bursts of updates into one batch frame
+        const messages: WebSocketMessage[] = data.type === 'batch' ? data.events : [data];
+        for (const message of messages) {
+          console.log('WebSocket message:', message);
+          onMessage?.(message);
+        }
       } catch (error) {
         console.error('Failed to parse WebSocket message:', error);
       }
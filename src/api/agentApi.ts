@@ -208,8 +208,10 @@ export class TaskWebSocket {
 
         this.ws.onmessage = (event) => {
             try {
-                const message = JSON.parse(event.data);
-                this.onMessage(message);
+                const data = JSON.parse(event.data);
+                // The server coalesces bursts of updates into one batch frame
+                const messages: WebSocketMessage[] = data.type === 'batch' ? data.events : [data];
+                messages.forEach((message) => this.onMessage(message));
             } catch (error) {
                 console.error('Failed to parse WebSocket message:', error);
             }
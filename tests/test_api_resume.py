@@ -0,0 +1,73 @@
+"""Resuming a timed-out task in the serverless backend (api/index.py)"""
+import asyncio
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "api")]
+
+import index  # noqa: E402
+from app.models import ExecutionStep  # noqa: E402
+
+
+class FakePlanner:
+    async def create_plan(self, outcome, context):
+        return [
+            ExecutionStep(description=f"Step {n}", action_type="noop")
+            for n in range(1, 4)
+        ]
+
+
+class CountingExecutor:
+    def __init__(self):
+        self.runs = []
+
+    async def execute_step(self, step, context):
+        self.runs.append(step.description)
+        return {"success": True, "context_updates": {}}
+
+
+class FakeValidator:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+
+    async def validate_completion(self, outcome, context, history):
+        await asyncio.sleep(self.delay)
+        return {"completed": True}
+
+
+class ResumeAfterTimeoutTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.executor = CountingExecutor()
+        self.validator = FakeValidator(delay=1)
+        self.saved = (index.get_engines, index.TASK_TIMEOUT_SECONDS, index.task_store)
+        index.get_engines = lambda: (FakePlanner(), self.executor, self.validator)
+        index.TASK_TIMEOUT_SECONDS = 0.2
+        index.task_store = index.TaskStore()
+
+    def tearDown(self):
+        index.get_engines, index.TASK_TIMEOUT_SECONDS, index.task_store = self.saved
+
+    async def test_deadline_during_validation_does_not_rerun_steps(self):
+        task = index.Task(task_id="t1", user_id="u1", goal="Do three things", context={})
+        await index.save_task(task)
+
+        await index.run_with_deadline("t1")
+        task = await index.task_store.get("t1")
+        self.assertEqual(task.status, "timeout")
+        self.assertEqual([step.status for step in task.plan], ["completed"] * 3)
+        self.assertEqual(self.executor.runs, ["Step 1", "Step 2", "Step 3"])
+
+        self.validator.delay = 0
+        await index.respond_to_interrupt("t1", index.InterruptResponse(response={}))
+        await asyncio.gather(*index._bg_tasks)
+
+        task = await index.task_store.get("t1")
+        self.assertEqual(task.status, "completed")
+        self.assertEqual(self.executor.runs, ["Step 1", "Step 2", "Step 3"])
+
+
+if __name__ == "__main__":
+    unittest.main()